@@ -6,12 +6,18 @@
 import streamlit as st
 import sqlite3
 import random
+import itertools
+import collections
+import zlib
+import threading
+import socket
+import queue
+from concurrent.futures import Future
 import time
 import pandas as pd
 import datetime
 import re
 import argon2
-from streamlit_autorefresh import st_autorefresh
 import pydeck as pdk
 import plotly.graph_objects as go
 import yfinance as yf
@@ -91,9 +97,347 @@ WRITABLE_PATH = "/tmp/bank.db"
 if not os.path.exists(WRITABLE_PATH):
     shutil.copy(DB_PATH, WRITABLE_PATH)
 
+DB_BUSY_TIMEOUT_MS = 5000
+DB_CACHE_SIZE_KIB = 65536        # 64MB page cache per connection
+DB_MMAP_SIZE = 268435456         # 256MB memory-mapped reads
+
+def apply_connection_pragmas(conn):
+    conn.execute(f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute(f"PRAGMA cache_size = -{DB_CACHE_SIZE_KIB}")
+    conn.execute(f"PRAGMA mmap_size = {DB_MMAP_SIZE}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+
 @st.cache_resource
 def get_db_connection():
-    return sqlite3.connect(WRITABLE_PATH, check_same_thread=False, uri=True)
+    # The single writer connection, shared by every session. WAL lets readers keep going while it writes.
+    conn = sqlite3.connect(WRITABLE_PATH, check_same_thread=False, uri=True, timeout=DB_BUSY_TIMEOUT_MS / 1000)
+    conn.execute("PRAGMA journal_mode = WAL")
+    apply_connection_pragmas(conn)
+    return conn
+
+def open_read_connection():
+    try:
+        read_conn = sqlite3.connect(f"file:{WRITABLE_PATH}?mode=ro", check_same_thread=False, uri=True, timeout=DB_BUSY_TIMEOUT_MS / 1000)
+        read_conn.execute("SELECT 1 FROM sqlite_master LIMIT 1")
+    except sqlite3.OperationalError:
+        read_conn = sqlite3.connect(WRITABLE_PATH, check_same_thread=False, uri=True, timeout=DB_BUSY_TIMEOUT_MS / 1000)
+    apply_connection_pragmas(read_conn)
+    return read_conn
+
+def get_read_connection():
+    # One read-only connection per session; a session only ever runs one script thread at a time.
+    if "read_conn" not in st.session_state:
+        st.session_state.read_conn = open_read_connection()
+    return st.session_state.read_conn
+
+WRITE_BATCH_MAX_UNITS = 64
+WRITE_GROUP_COMMIT_WINDOW = 0.002  # seconds the writer waits for concurrent units to join a batch
+WRITER_THREAD_NAME = "bank-writer"
+
+def run_writer(work):
+    writer_conn = sqlite3.connect(WRITABLE_PATH, isolation_level=None, timeout=DB_BUSY_TIMEOUT_MS / 1000)
+    apply_connection_pragmas(writer_conn)
+    c = writer_conn.cursor()
+
+    while True:
+        batch = [work.get()]
+        while len(batch) < WRITE_BATCH_MAX_UNITS:
+            try:
+                batch.append(work.get(timeout=WRITE_GROUP_COMMIT_WINDOW))
+            except queue.Empty:
+                break
+
+        outcomes = []
+        try:
+            c.execute("BEGIN IMMEDIATE")
+            for unit, future in batch:
+                # Each unit gets a savepoint so one failing action does not roll back its neighbours.
+                c.execute("SAVEPOINT unit")
+                try:
+                    outcomes.append((future, unit(c), None))
+                    c.execute("RELEASE unit")
+                except Exception as e:
+                    c.execute("ROLLBACK TO unit")
+                    c.execute("RELEASE unit")
+                    outcomes.append((future, None, e))
+            c.execute("COMMIT")
+        except Exception as e:
+            if writer_conn.in_transaction:
+                writer_conn.rollback()
+            outcomes = [(future, None, e) for _, future in batch]
+        # Published after COMMIT (and before callers are released) so no session can cache pre-commit rows under the new version.
+        publish_account_changes()
+
+        for future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+@st.cache_resource
+def get_write_queue():
+    work = queue.Queue()
+    threading.Thread(target=run_writer, args=(work,), name=WRITER_THREAD_NAME, daemon=True).start()
+    return work
+
+def submit_write(unit):
+    # unit(c) runs on the writer thread inside a shared BEGIN IMMEDIATE transaction; it must not commit.
+    future = Future()
+    get_write_queue().put((unit, future))
+    return future
+
+def run_write(unit):
+    return submit_write(unit).result()
+
+@st.cache_resource
+def get_id_blocks():
+    return {"lock": threading.Lock(), "ranges": {}}
+
+def reserve_id_block(name, size):
+    def reserve(c):
+        c.execute("UPDATE id_sequences SET next_id = next_id + ? WHERE name = ?", (size, name))
+        return c.execute("SELECT next_id FROM id_sequences WHERE name = ?", (name,)).fetchone()[0] - size
+
+    return run_write(reserve)
+
+def next_id(name):
+    # Reserving a block goes through the writer queue, so ids must be taken before a unit is submitted, never inside one.
+    if threading.current_thread().name == WRITER_THREAD_NAME:
+        raise RuntimeError("next_id() cannot be called from inside a write unit")
+
+    blocks = get_id_blocks()
+    with blocks["lock"]:
+        start, end = blocks["ranges"].get(name, (0, 0))
+        if start >= end:
+            size = ID_SEQUENCES[name][2]
+            start = reserve_id_block(name, size)
+            end = start + size
+        blocks["ranges"][name] = (start + 1, end)
+        return start
+
+TRANSACTION_TYPES = {
+    # name: (type_code, direction) -- direction is the effect on the vault: 1 in, -1 out, 0 none
+    "other": (0, 0),
+    "transfer_out": (1, -1),
+    "transfer_in": (2, 1),
+    "transfer_declined": (3, 1),
+    "savings_deposit": (4, -1),
+    "savings_withdrawal": (5, 1),
+    "stock_buy": (6, -1),
+    "stock_sell": (7, 1),
+    "dividend": (8, 1),
+    "item_buy": (9, -1),
+    "property_buy": (10, -1),
+    "property_upgrade": (11, -1),
+    "property_sell": (12, 1),
+    "rent": (13, 1),
+    "gift": (14, 0),
+    "blackmarket_listing": (15, 0),
+    "loan_borrow": (16, 1),
+    "loan_repay": (17, -1),
+    "investment": (18, -1),
+    "investment_return": (19, 1),
+    "investment_fail": (20, -1),
+    "country_shares": (21, -1),
+    "membership": (22, -1),
+    "daily_fee": (23, -1),
+    "living_tax": (24, -1),
+}
+
+TRANSACTION_TYPE_LABELS = {
+    # Fixed labels matched exactly, and only on rows without a receiver: a peer transfer is
+    # "Transfer to {username}", and a username can start with (or be) "Vault" or "Savings".
+    "Transfer To Savings": "savings_deposit",
+    "Transfer to Vault": "savings_withdrawal",
+}
+TRANSACTION_TYPE_PREFIXES = [
+    # Matched case-insensitively and in order.
+    ("Transfer to", "transfer_out"),
+    ("Transfer Accepted", "transfer_in"),
+    ("Transfer Declined", "transfer_declined"),
+    ("Buy Stock", "stock_buy"),
+    ("Sell Stock", "stock_sell"),
+    ("Dividend Payout", "dividend"),
+    ("Buy GNFT", "item_buy"),
+    ("Property Purchase", "property_buy"),
+    ("Upgrade Property", "property_upgrade"),
+    ("Sell Property", "property_sell"),
+    ("Collect Rent", "rent"),
+    ("Gift", "gift"),
+    ("Put GNFT", "blackmarket_listing"),
+    ("Borrow Loan", "loan_borrow"),
+    ("Repay Loan", "loan_repay"),
+    ("Investment Initiated", "investment"),
+    ("Investment Return", "investment_return"),
+    ("Investment Fail", "investment_fail"),
+    ("Buy Country Shares", "country_shares"),
+    ("Membership Card Purchase", "membership"),
+    ("Daily Fee", "daily_fee"),
+    ("Monthly Living Tax", "living_tax"),
+]
+
+def classify_transaction(type, receiver_username=None):
+    if receiver_username is None and type in TRANSACTION_TYPE_LABELS:
+        return TRANSACTION_TYPES[TRANSACTION_TYPE_LABELS[type]]
+    lowered = type.lower()
+    for prefix, name in TRANSACTION_TYPE_PREFIXES:
+        if lowered.startswith(prefix.lower()):
+            return TRANSACTION_TYPES[name]
+    return TRANSACTION_TYPES["other"]
+
+# Fixed SQL text per leg kind so sqlite3's statement cache keeps every posting statement prepared.
+POSTING_STATEMENTS = {
+    "debit_user": "UPDATE users SET balance = balance - ? WHERE user_id = ? AND balance >= ?",
+    "charge_user": "UPDATE users SET balance = balance - ? WHERE user_id = ?",
+    "credit_user": "UPDATE users SET balance = balance + ? WHERE user_id = ?",
+    "debit_savings": "UPDATE savings SET balance = balance - ? WHERE user_id = ? AND balance >= ?",
+    "credit_savings": "UPDATE savings SET balance = balance + ? WHERE user_id = ?",
+    "debit_treasury": "UPDATE users SET balance = balance - ? WHERE username = 'Government'",
+    "credit_treasury": "UPDATE users SET balance = balance + ? WHERE username = 'Government'",
+    "stamp_user": "UPDATE users SET last_transaction_time = ? WHERE user_id = ?",
+    "record": "INSERT INTO transactions (transaction_id, user_id, type, amount, receiver_username, status, stock_id, quantity, type_code, direction, signed_amount, balance_after) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+}
+CHECKED_POSTINGS = {"debit_user", "debit_savings"}
+VAULT_POSTINGS = {"debit_user": -1, "charge_user": -1, "credit_user": 1}
+# kind -> index of the user_id in its params, for invalidating that user's cached AccountSnapshot
+ACCOUNT_POSTINGS = {"debit_user": 1, "charge_user": 1, "credit_user": 1, "debit_savings": 1, "credit_savings": 1, "stamp_user": 1}
+
+def debit_user(user_id, amount):
+    return ("debit_user", (amount, user_id, amount))
+
+def charge_user(user_id, amount):
+    return ("charge_user", (amount, user_id))
+
+def credit_user(user_id, amount):
+    return ("credit_user", (amount, user_id))
+
+def debit_savings(user_id, amount):
+    return ("debit_savings", (amount, user_id, amount))
+
+def credit_savings(user_id, amount):
+    return ("credit_savings", (amount, user_id))
+
+def debit_treasury(amount):
+    return ("debit_treasury", (amount,))
+
+def credit_treasury(amount):
+    return ("credit_treasury", (amount,))
+
+def stamp_user(user_id):
+    return ("stamp_user", (datetime.datetime.now().isoformat(), user_id))
+
+def record_transaction(user_id, type, amount, receiver_username=None, status=None, stock_id=0, quantity=0, transaction_id=None):
+    if transaction_id is None:
+        transaction_id = next_id("transactions")
+    return ("record", (transaction_id, user_id, type, amount, receiver_username, status, stock_id, quantity) + classify_transaction(type, receiver_username))
+
+def apply_postings(c, legs):
+    records = []
+    vault_deltas = {}
+    for kind, params in legs:
+        if kind == "record":
+            records.append(params)
+            continue
+        if c.execute(POSTING_STATEMENTS[kind], params).rowcount == 0 and kind in CHECKED_POSTINGS:
+            raise ValueError("Insufficient funds.")
+        if kind in VAULT_POSTINGS:
+            amount, user_id = params[:2]
+            vault_deltas[user_id] = vault_deltas.get(user_id, 0) + VAULT_POSTINGS[kind] * amount
+        if kind in ACCOUNT_POSTINGS:
+            get_account_versions()["pending"].add(params[ACCOUNT_POSTINGS[kind]])
+
+    # Ledger rows are written last so they carry the net vault movement of the whole posting and the balance it left behind.
+    for params in records:
+        user_id = params[1]
+        get_account_versions()["pending"].add(user_id)
+        balance = c.execute("SELECT balance FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        c.execute(POSTING_STATEMENTS["record"], params + (vault_deltas.pop(user_id, 0), balance[0] if balance else None))
+
+def post(legs):
+    return run_write(lambda c: apply_postings(c, legs))
+
+ACCOUNT_SNAPSHOT_TTL_SECONDS = 30
+
+@st.cache_resource
+def get_account_versions():
+    # user_id -> version, bumped by the writer after it commits postings for that user; "pending" is only touched on the writer thread.
+    return {"versions": {}, "pending": set()}
+
+def publish_account_changes():
+    account_versions = get_account_versions()
+    versions = account_versions["versions"]
+    for user_id in account_versions["pending"]:
+        versions[user_id] = versions.get(user_id, 0) + 1
+    account_versions["pending"].clear()
+
+def load_account_snapshot(c, user_id):
+    row = c.execute("""
+        SELECT u.balance, COALESCE(u.loan, 0), u.credit_score, u.login_streak, u.vip_tier, u.card_url,
+               u.has_savings_account, u.net_worth, sv.balance, sv.interest_rate,
+               COALESCE((SELECT SUM(us.quantity * s.price) FROM user_stocks us JOIN stocks s ON s.stock_id = us.stock_id WHERE us.user_id = u.user_id), 0),
+               COALESCE((SELECT SUM(re.price) FROM real_estate re WHERE re.user_id = u.user_id), 0),
+               COALESCE((SELECT SUM(ucs.shares_owned / 100.0 * cl.total_worth) FROM user_country_shares ucs JOIN country_lands cl ON cl.country_id = ucs.country_id WHERE ucs.user_id = u.user_id), 0)
+        FROM users u
+        LEFT JOIN savings sv ON sv.user_id = u.user_id
+        WHERE u.user_id = ?
+    """, (user_id,)).fetchone()
+    if row is None:
+        return None
+    balance, loan, credit_score, login_streak, vip_tier, card_url, has_savings_account, net_worth, savings, interest_rate, stocks_value, property_value, land_value = row
+    return {
+        "balance": balance,
+        "loan": loan,
+        "credit_score": credit_score,
+        "login_streak": login_streak,
+        "vip_tier": vip_tier,
+        "card_url": card_url,
+        "has_savings_account": has_savings_account,
+        "net_worth": net_worth,
+        "savings": savings if has_savings_account and savings is not None else 0,
+        "interest_rate": interest_rate,
+        "stocks_value": stocks_value,
+        "property_value": property_value,
+        "land_value": land_value,
+    }
+
+def get_account_snapshot(c, user_id):
+    # Postings bump the user's version; direct writes on the shared connection move total_changes; anything else (market moves) ages out.
+    key = (user_id, get_account_versions()["versions"].get(user_id, 0), c.connection.total_changes)
+    cached = st.session_state.get("account_snapshot")
+    if cached and cached[0] == key and time.time() - cached[1] < ACCOUNT_SNAPSHOT_TTL_SECONDS:
+        return cached[2]
+
+    snapshot = load_account_snapshot(c, user_id)
+    st.session_state.account_snapshot = (key, time.time(), snapshot)
+    return snapshot
+
+# name -> (table whose version keys the cache, query); rows are keyed by their first column.
+REFERENCE_QUERIES = {
+    "stocks": ("stocks", "SELECT stock_id, name, symbol, price, stock_amount, dividend_rate FROM stocks"),
+    "marketplace_items": ("marketplace_items", "SELECT item_id, name, description, rarity, price, stock, image_url FROM marketplace_items"),
+    "investment_companies": ("investment_companies", "SELECT company_id, company_name, risk_level FROM investment_companies"),
+    "country_lands": ("country_lands", "SELECT country_id, name, total_worth, share_price, latitude, longitude, border_geometry, image_url FROM country_lands"),
+    "job_posters": ("job_posters", "SELECT job_poster_id, job_title, company_id, starting_wage, description FROM job_posters"),
+    "latest_quiz": ("quizzes", "SELECT quiz_id, question, option_a, option_b, option_c, option_d, correct_option, quiz_type, cash_prize FROM quizzes ORDER BY date_added DESC LIMIT 1"),
+    "news": ("news", "SELECT news_id, title, content, likes, dislikes, created, category FROM news ORDER BY created DESC"),
+    "chat_channels": ("chat_channels", "SELECT channel_id, name, label, retention_days FROM chat_channels ORDER BY channel_id"),
+}
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def load_reference(name, version):
+    # version comes from table_versions, which triggers bump on every write, so each version is decoded once for all sessions.
+    read_conn = open_read_connection()
+    try:
+        rows = read_conn.execute(REFERENCE_QUERIES[name][1]).fetchall()
+    finally:
+        read_conn.close()
+    return {"rows": rows, "by_id": {row[0]: row for row in rows}}
+
+def get_reference(c, name):
+    table = REFERENCE_QUERIES[name][0]
+    version = c.execute("SELECT version FROM table_versions WHERE name = ?", (table,)).fetchone()
+    return load_reference(name, version[0] if version else 0)
 
 conn = get_db_connection()
 
@@ -226,55 +570,110 @@ def check_cooldown(conn, user_id):
             return False
     return True
 
-def update_last_transaction_time(conn, user_id):
-    c = conn.cursor()
-    c.execute("UPDATE users SET last_transaction_time = ? WHERE user_id = ?", (datetime.datetime.now().isoformat(), user_id))
-    conn.commit()
+ACTIVITY_BUCKET_SECONDS = 3600
+ACTIVITY_RETENTION_SECONDS = 2 * 86400
+ACTIVITY_BUCKET_EXPR = f"CAST(COALESCE(strftime('%s', NEW.timestamp), strftime('%s', 'now')) AS INTEGER) / {ACTIVITY_BUCKET_SECONDS} * {ACTIVITY_BUCKET_SECONDS}"
 
-def recent_transactions_metrics(c, user_id):
-    current_time = pd.Timestamp.now()
-    last_24_hours = current_time - pd.Timedelta(days=1)
-    last_24_hours_str = last_24_hours.strftime('%Y-%m-%d %H:%M:%S')
-
-    transactions = c.execute("""
-        SELECT type, COUNT(*), IFNULL(SUM(amount), 0) 
-        FROM transactions 
-        WHERE user_id = ? AND timestamp >= ? 
-        GROUP BY type
-    """, (user_id, last_24_hours_str)).fetchall()
+def activity_window_start(hours=24):
+    # Ledger timestamps default to CURRENT_TIMESTAMP (UTC), so buckets are true epochs; the window covers the current bucket and the 23 before it.
+    return int(time.time()) // ACTIVITY_BUCKET_SECONDS * ACTIVITY_BUCKET_SECONDS - (hours - 1) * ACTIVITY_BUCKET_SECONDS
 
-    metrics = {
-        "Incoming Transfers": {"count": 0, "total": 0},
-        "Outgoing Transfers": {"count": 0, "total": 0},
-    }
-
-    for trans_type, count, total in transactions:
-        if trans_type.lower().startswith("transfer to"):
-            metrics["Outgoing Transfers"] = {"count": count, "total": total}
-        elif trans_type.lower().startswith("transfer from"):
-            metrics["Incoming Transfers"] = {"count": count, "total": total}
+def recent_transactions_metrics(c, user_id):
+    transactions = dict((type_code, (count, total)) for type_code, count, total in c.execute("""
+        SELECT type_code, SUM(count), SUM(total)
+        FROM user_activity_hourly
+        WHERE user_id = ? AND type_code IN (?, ?) AND bucket >= ?
+        GROUP BY type_code
+    """, (user_id, TRANSACTION_TYPES["transfer_in"][0], TRANSACTION_TYPES["transfer_out"][0], activity_window_start())).fetchall())
+
+    metrics = {}
+    for label, name in (("Incoming Transfers", "transfer_in"), ("Outgoing Transfers", "transfer_out")):
+        count, total = transactions.get(TRANSACTION_TYPES[name][0], (0, 0))
+        metrics[label] = {"count": count, "total": total}
 
     return metrics
     
-def leaderboard_logic(c):
-    result = c.execute("SELECT username, visible_name, balance FROM users ORDER BY balance DESC").fetchall()
-
-    leaderboard = []
-    rank = 1
-    for row in result:
-        username, visible_name, balance = row
-        name_to_display = visible_name if visible_name else username
-        leaderboard.append({
-            "rank": rank,
-            "name": name_to_display,
-            "balance": balance
-        })
-        rank += 1
-
-    return leaderboard
+RANK_SOURCES = {
+    # metric: (rows, score column, visibility filter)
+    "vault": ("users", "balance", "show_main_balance_on_leaderboard = 1"),
+    # Same row set as the savings leaderboard: players without a savings account rank at 0.
+    "savings": ("users LEFT JOIN savings ON users.user_id = savings.user_id", "IFNULL(savings.balance, 0)", "show_savings_balance_on_leaderboard = 1"),
+    "worth": ("users", "net_worth", "show_main_balance_on_leaderboard = 1"),
+}
+
+def get_user_rank(c, user_id, metric):
+    rows, score_column, visible = RANK_SOURCES[metric]
+    score = c.execute(f"SELECT {score_column} FROM {rows} WHERE users.user_id = ?", (user_id,)).fetchone()
+    if not score:
+        return None
+    score = score[0]
+
+    # Vault and worth probes are range scans on a (visibility, score) index, so no query sorts the whole table.
+    ahead = c.execute(f"SELECT COUNT(*) FROM {rows} WHERE {visible} AND {score_column} > ?", (score,)).fetchone()[0]
+    above = c.execute(f"""
+        SELECT COALESCE(visible_name, username), {score_column} FROM {rows}
+        WHERE {visible} AND {score_column} > ?
+        ORDER BY {score_column} ASC LIMIT 1
+    """, (score,)).fetchone()
+    below = c.execute(f"""
+        SELECT COALESCE(visible_name, username), {score_column} FROM {rows}
+        WHERE {visible} AND {score_column} < ?
+        ORDER BY {score_column} DESC LIMIT 1
+    """, (score,)).fetchone()
+
+    return {"rank": ahead + 1, "score": score, "above": above, "below": below}
+
+SEARCH_RESULT_LIMIT = 100
+
+def search_match_expression(text):
+    # Quote every term so user input is never parsed as FTS syntax, and prefix-match it.
+    terms = re.findall(r"\w+", text)
+    return " ".join(f'"{term}"*' for term in terms) or None
+
+def search_chat(c, text, limit=SEARCH_RESULT_LIMIT):
+    match = search_match_expression(text)
+    if match is None:
+        return []
+    return c.execute("""
+        SELECT m.id, ch.label, u.username, m.message, m.timestamp
+        FROM chat_messages_fts f
+        JOIN chat_messages m ON m.id = f.rowid
+        JOIN chat_channels ch ON ch.channel_id = m.channel_id
+        LEFT JOIN users u ON u.user_id = m.user_id
+        WHERE chat_messages_fts MATCH ?
+        ORDER BY f.rank
+        LIMIT ?
+    """, (match, limit)).fetchall()
+
+def search_transactions(c, text, user_id=None, limit=SEARCH_RESULT_LIMIT):
+    match = search_match_expression(text)
+    if match is None:
+        return []
+    return c.execute("""
+        SELECT t.transaction_id, u.username, t.type, t.amount, t.receiver_username, t.status, t.timestamp
+        FROM transactions_fts f
+        JOIN transactions t ON t.transaction_id = f.rowid
+        LEFT JOIN users u ON u.user_id = t.user_id
+        WHERE transactions_fts MATCH ? AND (? IS NULL OR t.user_id = ?)
+        ORDER BY f.rank
+        LIMIT ?
+    """, (match, user_id, user_id, limit)).fetchall()
+
+def search_news(c, text, limit=SEARCH_RESULT_LIMIT):
+    match = search_match_expression(text)
+    if match is None:
+        return []
+    return c.execute("""
+        SELECT n.news_id, n.title, n.content, n.category, n.created
+        FROM news_fts f
+        JOIN news n ON n.news_id = f.rowid
+        WHERE news_fts MATCH ?
+        ORDER BY f.rank
+        LIMIT ?
+    """, (match, limit)).fetchall()
 
 def get_transaction_history(conn, user_id):
-    c = conn.cursor()
+    c = get_read_connection().cursor()
 
     query = "SELECT transaction_id, type, amount, receiver_username, status, stock_id, quantity, timestamp FROM transactions WHERE user_id = ? ORDER BY timestamp DESC"
 
@@ -314,12 +713,57 @@ def claim_daily_reward(conn, user_id):
         conn.commit()
         time.sleep(3)
 
-def update_stock_prices(conn):
-    c = conn.cursor()
+market_rng = np.random.default_rng()
+
+STOCK_HISTORY_RETENTION = datetime.timedelta(days=2)
+# Candle width in seconds -> how long those candles are kept (None keeps them forever).
+CANDLE_RESOLUTIONS = {
+    60: datetime.timedelta(days=7),
+    3600: datetime.timedelta(days=90),
+    86400: None,
+}
+
+def naive_epoch(dt):
+    # Stock timestamps are naive; bucket them as UTC, the same way SQLite's strftime('%s') does.
+    return int((dt - datetime.datetime(1970, 1, 1)).total_seconds())
+
+def roll_up_ticks(c, stock_id, epochs, prices, now):
+    for resolution, retention in CANDLE_RESOLUTIONS.items():
+        if retention is not None:
+            keep = epochs >= naive_epoch(now - retention) // resolution * resolution
+            bucket_epochs, bucket_prices = epochs[keep], prices[keep]
+        else:
+            bucket_epochs, bucket_prices = epochs, prices
+        if len(bucket_epochs) == 0:
+            continue
+
+        buckets = bucket_epochs // resolution * resolution
+        starts = np.flatnonzero(np.r_[True, np.diff(buckets) != 0])
+        ends = np.r_[starts[1:], len(buckets)] - 1
+        c.executemany("""
+            INSERT INTO stock_candles (stock_id, resolution, bucket, open, high, low, close) VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(stock_id, resolution, bucket) DO UPDATE SET
+                high = MAX(high, excluded.high), low = MIN(low, excluded.low), close = excluded.close
+        """, zip(
+            itertools.repeat(stock_id), itertools.repeat(resolution), buckets[starts].tolist(),
+            bucket_prices[starts].tolist(), np.maximum.reduceat(bucket_prices, starts).tolist(),
+            np.minimum.reduceat(bucket_prices, starts).tolist(), bucket_prices[ends].tolist()
+        ))
+
+def update_stock_prices(c):
     now = datetime.datetime.now()
 
     stocks = c.execute("SELECT stock_id, price, last_updated, change_rate, open_price, close_price FROM stocks").fetchall()
 
+    history_cutoff = now - STOCK_HISTORY_RETENTION
+    c.execute("DELETE FROM stock_history WHERE timestamp < ?", (history_cutoff.strftime("%Y-%m-%d %H:%M:%S"),))
+    for resolution, retention in CANDLE_RESOLUTIONS.items():
+        if retention is not None:
+            c.execute("DELETE FROM stock_candles WHERE resolution = ? AND bucket < ?", (resolution, naive_epoch(now - retention) // resolution * resolution))
+    activity_cutoff = int(time.time()) - ACTIVITY_RETENTION_SECONDS
+    c.execute("DELETE FROM user_activity_hourly WHERE bucket < ?", (activity_cutoff,))
+    c.execute("DELETE FROM stock_activity_hourly WHERE bucket < ?", (activity_cutoff,))
+
     for stock_id, current_price, last_updated, change_rate, open_price, close_price in stocks:
         try:
             if last_updated:
@@ -333,86 +777,200 @@ def update_stock_prices(conn):
             elapsed_time = (now - last_updated).total_seconds()
             num_updates = int(elapsed_time // 60)
 
-            one_month_ago = now - datetime.timedelta(days=30)
-            c.execute(
-                "DELETE FROM stock_history WHERE stock_id = ? AND timestamp < ?",
-                (stock_id, one_month_ago.strftime("%Y-%m-%d %H:%M:%S"))
-            )
+            if num_updates <= 0:
+                continue
 
-            if num_updates > 0:
-                for i in range(num_updates):
-                    change_percent = round(random.uniform(-change_rate, change_rate), 2)
-                    new_price = max(1, round(current_price * (1 + change_percent / 100), 2))
+            change_percent = np.round(market_rng.uniform(-change_rate, change_rate, num_updates), 2)
+            path = np.maximum(1, np.round(current_price * np.cumprod(1 + change_percent / 100), 2))
+            tick_times = np.datetime64(last_updated, "s") + np.arange(1, num_updates + 1) * np.timedelta64(60, "s")
 
-                    missed_update_time = last_updated + datetime.timedelta(seconds=(i + 1) * 60)
-                    if missed_update_time <= now:
-                        c.execute(
-                            "INSERT INTO stock_history (stock_id, price, timestamp) VALUES (?, ?, ?)",
-                            (stock_id, new_price, missed_update_time.strftime("%Y-%m-%d %H:%M:%S"))
-                        )
-                    current_price = new_price
+            # Older minutes still move the price but would be pruned right away, so only the retained tail is written.
+            keep = tick_times >= np.datetime64(history_cutoff, "s")
+            timestamps = np.char.replace(np.datetime_as_string(tick_times[keep], unit="s"), "T", " ")
+            c.executemany(
+                "INSERT INTO stock_history (stock_id, price, timestamp) VALUES (?, ?, ?)",
+                zip(itertools.repeat(stock_id), path[keep].tolist(), timestamps.tolist())
+            )
+            roll_up_ticks(c, stock_id, tick_times.astype(np.int64), path, now)
 
+            current_price = float(path[-1])
             close_price = current_price
+            # Advance by whole minutes so ticks stay on the same clock instead of drifting with wake-up jitter.
+            last_tick = last_updated + datetime.timedelta(seconds=num_updates * 60)
             c.execute(
                 "UPDATE stocks SET price = ?, open_price = ?, close_price = ?, last_updated = ? WHERE stock_id = ?",
-                (current_price, open_price, close_price, now.strftime("%Y-%m-%d %H:%M:%S"), stock_id)
+                (current_price, open_price, close_price, last_tick.strftime("%Y-%m-%d %H:%M:%S"), stock_id)
             )
         except Exception as e:
             print(f"Error updating stock {stock_id}: {e}")
             continue
 
-    conn.commit()
+def get_candles(c, stock_id, start, bucket_seconds):
+    # Use the finest stored resolution that fits inside the requested bucket and still covers the window.
+    window_start = naive_epoch(start)
+    widths = list(CANDLE_RESOLUTIONS)
+    resolution = widths[0]
+    for width in widths[1:]:
+        retention = CANDLE_RESOLUTIONS[resolution]
+        if width <= bucket_seconds or (retention is not None and start < datetime.datetime.now() - retention):
+            resolution = width
+    rows = c.execute("""
+        SELECT bucket, open, high, low, close FROM stock_candles
+        WHERE stock_id = ? AND resolution = ? AND bucket >= ?
+        ORDER BY bucket ASC
+    """, (stock_id, resolution, window_start // resolution * resolution)).fetchall()
+    if not rows:
+        return []
 
-def get_stock_metrics(conn, stock_id):
-    c = conn.cursor()
-    
-    last_24_hours = datetime.datetime.now() - datetime.timedelta(days=1)
-    
-    result = c.execute("""
-        SELECT MIN(price), MAX(price), price 
-        FROM stock_history 
-        WHERE stock_id = ? AND timestamp >= ?
-    """, (stock_id, last_24_hours.strftime("%Y-%m-%d %H:%M:%S"))).fetchone()
-    
-    low_24h, high_24h, last_price = result if result else (None, None, None)
+    candles = np.array(rows, dtype=float)
+    if bucket_seconds > resolution:
+        buckets = candles[:, 0].astype(np.int64) // int(bucket_seconds) * int(bucket_seconds)
+        starts = np.flatnonzero(np.r_[True, np.diff(buckets) != 0])
+        ends = np.r_[starts[1:], len(buckets)] - 1
+        candles = np.column_stack([
+            buckets[starts], candles[starts, 1], np.maximum.reduceat(candles[:, 2], starts),
+            np.minimum.reduceat(candles[:, 3], starts), candles[ends, 4]
+        ])
+
+    return [
+        {"time": int(bucket), "open": open, "high": high, "low": low, "close": close}
+        for bucket, open, high, low, close in candles.tolist()
+    ]
 
+MARKET_TICK_SECONDS = 60
+MARKET_LEASE_SECONDS = 180
+
+def acquire_lease(c, name, holder, ttl):
+    now = time.time()
     c.execute("""
-        SELECT MIN(price), MAX(price) 
-        FROM stock_history 
-        WHERE stock_id = ?
-    """, (stock_id,))
-    
-    result = c.fetchone()
-    all_time_low, all_time_high = result if result else (None, None)
-    
+        INSERT INTO scheduler_leases (name, holder, expires_at) VALUES (?, ?, ?)
+        ON CONFLICT(name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at
+        WHERE scheduler_leases.holder = excluded.holder OR scheduler_leases.expires_at < ?
+    """, (name, holder, now + ttl, now))
+    return c.rowcount > 0
+
+NET_WORTH_HISTORY_DAYS = 365
+
+def take_net_worth_snapshot(c, day):
+    if c.execute("SELECT 1 FROM net_worth_snapshots WHERE day = ? LIMIT 1", (day,)).fetchone():
+        return
+
+    # One set-based pass: each holding is aggregated once per table and joined, rather than priced user by user.
     c.execute("""
-        SELECT price 
-        FROM stock_history 
-        WHERE stock_id = ? AND timestamp >= ?
-        ORDER BY timestamp ASC
-        LIMIT 1
-    """, (stock_id, last_24_hours.strftime("%Y-%m-%d %H:%M:%S")))
-    
-    price_24h_ago = c.fetchone()
-    price_24h_ago = price_24h_ago[0] if price_24h_ago else last_price
+        INSERT INTO net_worth_snapshots (user_id, day, balance, savings, stocks, properties, lands, loan)
+        SELECT u.user_id, ?, COALESCE(u.balance, 0),
+               CASE WHEN u.has_savings_account THEN COALESCE(sv.total, 0) ELSE 0 END,
+               COALESCE(st.total, 0), COALESCE(re.total, 0), COALESCE(ls.total, 0), COALESCE(u.loan, 0)
+        FROM users u
+        LEFT JOIN (SELECT user_id, SUM(balance) AS total FROM savings GROUP BY user_id) sv ON sv.user_id = u.user_id
+        LEFT JOIN (SELECT us.user_id, SUM(us.quantity * s.price) AS total FROM user_stocks us JOIN stocks s ON s.stock_id = us.stock_id GROUP BY us.user_id) st ON st.user_id = u.user_id
+        LEFT JOIN (SELECT user_id, SUM(price) AS total FROM real_estate GROUP BY user_id) re ON re.user_id = u.user_id
+        LEFT JOIN (SELECT ucs.user_id, SUM(ucs.shares_owned / 100.0 * cl.total_worth) AS total FROM user_country_shares ucs JOIN country_lands cl ON cl.country_id = ucs.country_id GROUP BY ucs.user_id) ls ON ls.user_id = u.user_id
+        WHERE true
+        ON CONFLICT (user_id, day) DO NOTHING
+    """, (day,))
+
+def get_net_worth_history(c, user_id, days=NET_WORTH_HISTORY_DAYS):
+    since = (datetime.date.today() - datetime.timedelta(days=days)).isoformat()
+    return c.execute("""
+        SELECT day, balance + savings + stocks + properties + lands - loan
+        FROM net_worth_snapshots
+        WHERE user_id = ? AND day > ?
+        ORDER BY day
+    """, (user_id, since)).fetchall()
+
+def run_market_scheduler(holder):
+    def market_tick(c):
+        # Only the process holding the lease ticks; the others keep retrying in case it dies.
+        if acquire_lease(c, "market", holder, MARKET_LEASE_SECONDS):
+            update_stock_prices(c)
+            take_net_worth_snapshot(c, datetime.date.today().isoformat())
+            # chat_messages.timestamp is CURRENT_TIMESTAMP, i.e. UTC, so retention days are UTC days too.
+            archive_chat_messages(c, datetime.datetime.now(datetime.timezone.utc).date())
+
+    while True:
+        try:
+            run_write(market_tick)
+        except Exception as e:
+            print(f"Market tick failed: {e}")
+        time.sleep(MARKET_TICK_SECONDS - time.time() % MARKET_TICK_SECONDS)
+
+@st.cache_resource
+def start_market_scheduler():
+    holder = f"{socket.gethostname()}:{os.getpid()}"
+    threading.Thread(target=run_market_scheduler, args=(holder,), name="market-scheduler", daemon=True).start()
+    return holder
 
-    delta_24h_high = last_price - high_24h if high_24h else None
-    delta_24h_low = last_price - low_24h if low_24h else None
-    delta_all_time_high = last_price - all_time_high if all_time_high else None
-    delta_all_time_low = last_price - all_time_low if all_time_low else None
-    price_change_percent = ((last_price - price_24h_ago) / price_24h_ago * 100) if price_24h_ago else 0
+def get_market_tick(c):
+    return c.execute("SELECT MAX(last_updated), COUNT(*) FROM stocks").fetchone()
 
-    return {
-        "low_24h": low_24h,
-        "high_24h": high_24h,
-        "all_time_low": all_time_low,
-        "all_time_high": all_time_high,
-        "price_change": price_change_percent,
-        "delta_24h_high": delta_24h_high,
-        "delta_24h_low": delta_24h_low,
-        "delta_all_time_high": delta_all_time_high,
-        "delta_all_time_low": delta_all_time_low
-    }
+@st.cache_data(show_spinner=False, max_entries=2)
+def load_market_stats(tick):
+    # tick is the latest stocks.last_updated plus the stock count, so the cache turns over on every scheduler tick or new listing.
+    now = datetime.datetime.now()
+    day_start = naive_epoch(now - datetime.timedelta(days=1))
+
+    read_conn = open_read_connection()
+    try:
+        rows = read_conn.execute("""
+            WITH day AS (
+                SELECT stock_id, MIN(low) AS low_24h, MAX(high) AS high_24h
+                FROM stock_candles
+                WHERE resolution = 3600 AND bucket >= ?
+                GROUP BY stock_id
+            ),
+            opening AS (
+                SELECT stock_id, open AS open_24h
+                FROM (
+                    SELECT stock_id, open, ROW_NUMBER() OVER (PARTITION BY stock_id ORDER BY bucket ASC) AS rank
+                    FROM stock_candles
+                    WHERE resolution = 60 AND bucket >= ?
+                )
+                WHERE rank = 1
+            ),
+            ever AS (
+                SELECT stock_id, MIN(low) AS all_time_low, MAX(high) AS all_time_high
+                FROM stock_candles
+                WHERE resolution = 86400
+                GROUP BY stock_id
+            ),
+            volume AS (
+                SELECT stock_id, SUM(volume) AS volume_24h
+                FROM stock_activity_hourly
+                WHERE bucket >= ?
+                GROUP BY stock_id
+            )
+            SELECT s.stock_id, s.price, day.low_24h, day.high_24h, opening.open_24h,
+                   ever.all_time_low, ever.all_time_high, COALESCE(volume.volume_24h, 0)
+            FROM stocks s
+            LEFT JOIN day ON day.stock_id = s.stock_id
+            LEFT JOIN opening ON opening.stock_id = s.stock_id
+            LEFT JOIN ever ON ever.stock_id = s.stock_id
+            LEFT JOIN volume ON volume.stock_id = s.stock_id
+        """, (day_start // 3600 * 3600, day_start // 60 * 60, activity_window_start())).fetchall()
+    finally:
+        read_conn.close()
+
+    stats = {}
+    for stock_id, last_price, low_24h, high_24h, open_24h, all_time_low, all_time_high, volume_24h in rows:
+        price_24h_ago = open_24h if open_24h else last_price
+        stats[stock_id] = {
+            "low_24h": low_24h,
+            "high_24h": high_24h,
+            "open_24h": open_24h,
+            "all_time_low": all_time_low,
+            "all_time_high": all_time_high,
+            "price_change": ((last_price - price_24h_ago) / price_24h_ago * 100) if price_24h_ago else 0,
+            "volume_24h": volume_24h,
+            "delta_24h_high": last_price - high_24h if high_24h else None,
+            "delta_24h_low": last_price - low_24h if low_24h else None,
+            "delta_all_time_high": last_price - all_time_high if all_time_high else None,
+            "delta_all_time_low": last_price - all_time_low if all_time_low else None
+        }
+    return stats
+
+def get_market_stats(c):
+    return load_market_stats(get_market_tick(c))
 
 def distribute_dividends(conn):
     c = conn.cursor()
@@ -420,8 +978,8 @@ def distribute_dividends(conn):
     today_str = now.strftime("%Y-%m-%d")
     
     if c.execute(
-        "SELECT COUNT(*) FROM transactions WHERE type = 'Dividend Payout' AND DATE(timestamp)=?",
-        (today_str,)
+        "SELECT COUNT(*) FROM transactions WHERE type_code = ? AND timestamp >= ?",
+        (TRANSACTION_TYPES["dividend"][0], today_str)
     ).fetchone()[0] > 0:
         return
 
@@ -433,24 +991,37 @@ def distribute_dividends(conn):
     """, ((now - datetime.timedelta(days=7)).strftime("%Y-%m-%d %H:%M:%S"),)).fetchall()
 
     dividends_paid = {}
+    payouts = []
     for user_id, stock_id, quantity, price, dividend_rate, purchase_date in user_stocks:
         dividend = round(quantity * price * dividend_rate, 2)
         dividends_paid[user_id] = dividends_paid.get(user_id, 0) + dividend
+        payouts.append((next_id("transactions"), user_id, dividend, stock_id, now.strftime("%Y-%m-%d %H:%M:%S")))
 
-        c.execute("""
-            INSERT INTO transactions (user_id, type, amount, stock_id, status, timestamp)
-            VALUES (?, 'Dividend Payout', ?, ?, 'Completed', ?)
-        """, (user_id, dividend, stock_id, now.strftime("%Y-%m-%d %H:%M:%S")))
+    def pay_dividends(c):
+        if c.execute("SELECT COUNT(*) FROM transactions WHERE type_code = ? AND timestamp >= ?", (TRANSACTION_TYPES["dividend"][0], today_str)).fetchone()[0] > 0:
+            return False
+        apply_postings(c, [credit_user(user_id, total_dividend) for user_id, total_dividend in dividends_paid.items()])
+
+        running = {user_id: c.execute("SELECT balance FROM users WHERE user_id = ?", (user_id,)).fetchone()[0] - total_dividend for user_id, total_dividend in dividends_paid.items()}
+        rows = []
+        for transaction_id, user_id, dividend, stock_id, timestamp in payouts:
+            running[user_id] += dividend
+            rows.append((transaction_id, user_id, dividend, stock_id, timestamp) + TRANSACTION_TYPES["dividend"] + (dividend, running[user_id]))
+        c.executemany("""
+            INSERT INTO transactions (transaction_id, user_id, type, amount, stock_id, status, timestamp, type_code, direction, signed_amount, balance_after)
+            VALUES (?, ?, 'Dividend Payout', ?, ?, 'Completed', ?, ?, ?, ?, ?)
+        """, rows)
+        return True
+
+    if not run_write(pay_dividends):
+        return
 
     logged_in_user = st.session_state.user_id
 
     for user_id, total_dividend in dividends_paid.items():
-        c.execute("UPDATE users SET balance = balance + ? WHERE user_id = ?", (total_dividend, user_id))
         if user_id == logged_in_user:
             st.toast(f"💰 Dividend Payout: Received :green[${total_dividend}]")
 
-    conn.commit()
-
 def update_inflation(conn):
     c = conn.cursor()
     
@@ -465,11 +1036,6 @@ def update_inflation(conn):
     c.execute("INSERT INTO inflation_history (date, inflation_rate) VALUES (?, ?)", (today, new_inflation))
     conn.commit()
 
-def get_latest_message_time(conn):
-    c = conn.cursor()
-    latest = c.execute("SELECT MAX(timestamp) FROM chats").fetchone()[0]
-    return latest if latest else "1970-01-01 00:00:00"
-
 def get_inflation_history(c):
     history = c.execute("SELECT date, inflation_rate FROM inflation_history ORDER BY date ASC").fetchall()
     return pd.DataFrame(history, columns=["Date", "Inflation Rate"])
@@ -536,25 +1102,29 @@ def check_and_update_investments(conn, user_id):
                 profit = -amount
                 outcome = "loss"
 
-            c.execute("UPDATE users SET balance = balance + ? WHERE user_id = ?", (profit, user_id))
+            legs = [
+                credit_user(user_id, profit),
+                record_transaction(user_id, "Investment Return" if success else "Investment Fail", profit),
+            ]
 
-            c.execute("""
-                UPDATE investments 
-                SET status = ?, return_rate = ? 
-                WHERE investment_id = ?
-            """, (outcome, profit, investment_id))
+            def settle_investment(c):
+                if c.execute("""
+                    UPDATE investments 
+                    SET status = ?, return_rate = ? 
+                    WHERE investment_id = ? AND status = 'pending'
+                """, (outcome, profit, investment_id)).rowcount == 0:
+                    return False
+                apply_postings(c, legs)
+                return True
 
-            conn.commit()
+            if not run_write(settle_investment):
+                continue
 
             if success:
-                c.execute("INSERT INTO transactions (transaction_id, user_id, type, amount) VALUES (?, ?, ?, ?)", (random.randint(100000000000, 999999999999), user_id, "Investment Return", profit))
                 st.toast(f"✅ Your investment in {company_name} has completed successfully! You earned :green[${format_number(profit)}].")
             else:
-                c.execute("INSERT INTO transactions (transaction_id, user_id, type, amount) VALUES (?, ?, ?, ?)", (random.randint(100000000000, 999999999999), user_id, "Investment Fail", profit))
                 st.toast(f"❌ Your investment in {company_name} failed. You lost :red[${format_number(amount)}].")
 
-    conn.commit()
-
 @st.fragment()
 def collect_rent(conn, user_id):
     c = conn.cursor()
@@ -652,34 +1222,22 @@ def load_lands_from_json(conn, json_file):
 
     conn.commit()
 
+BALANCE_TREND_DAYS = 365
+
 def get_balance_trend(conn, user_id):
     c = conn.cursor()
-    
-    transactions_query = """
-        SELECT timestamp, type, amount 
-        FROM transactions 
-        WHERE user_id = ? 
-        ORDER BY timestamp ASC
-    """
-    transactions = c.execute(transactions_query, (user_id,)).fetchall()
-
-    cumulative_balance = []
-    current_balance = 0
+    since = (datetime.datetime.now() - datetime.timedelta(days=BALANCE_TREND_DAYS)).strftime("%Y-%m-%d")
 
-    for transaction in transactions:
-        timestamp, transaction_type, amount = transaction
-        
-        if any(keyword in transaction_type for keyword in ["Buy", "Upgrade", "Repay", "Transfer to", "Gift", "Declined", "Purchase", "Fail"]):
-            current_balance += amount
-        elif any(keyword in transaction_type for keyword in ["Sell", "Dividend", "Collect", "Accepted", "Borrow", "Return"]):
-            current_balance -= amount
-        
-        cumulative_balance.append({
-            "time": timestamp.split(" ")[0],
-            "value": round(current_balance, 2)
-        })
+    # One point per day: the balance left by that day's last ledger row (bare column paired with MAX).
+    points = c.execute("""
+        SELECT DATE(timestamp), balance_after, MAX(timestamp)
+        FROM transactions
+        WHERE user_id = ? AND timestamp >= ? AND balance_after IS NOT NULL
+        GROUP BY DATE(timestamp)
+        ORDER BY 1
+    """, (user_id, since)).fetchall()
 
-    return cumulative_balance
+    return [{"time": day, "value": round(balance, 2)} for day, balance, _ in points]
 
 def prepare_chart_data(balance_trend):
     seriesAreaChart = [{
@@ -706,17 +1264,21 @@ def apply_daily_maintenance_cost(conn, user_id):
     total_worth = calculate_total_worth(c, user_id)
     fee = total_worth * 0.005 * days_passed
     
-    c.execute("UPDATE users SET balance = balance - ? WHERE user_id = ?", (fee, user_id))
-    c.execute("UPDATE users SET balance = balance + ? WHERE username = 'Government'", (fee,))
-    c.execute("INSERT INTO transactions (transaction_id, user_id, type, amount) VALUES (?, ?, ?, ?)", (random.randint(100000000000, 999999999999), user_id, "Daily Fee", fee))
-    
     new_maintenance_time = last_maintenance + datetime.timedelta(days=days_passed)
-    c.execute("UPDATE users SET last_maintenance_cost = ? WHERE user_id = ?",
-              (new_maintenance_time.strftime("%Y-%m-%d %H:%M:%S"), user_id))
-    
+
+    legs = [
+        charge_user(user_id, fee),
+        credit_treasury(fee),
+        record_transaction(user_id, "Daily Fee", fee),
+    ]
+
+    def charge_maintenance(c):
+        apply_postings(c, legs)
+        c.execute("UPDATE users SET last_maintenance_cost = ? WHERE user_id = ?",
+                  (new_maintenance_time.strftime("%Y-%m-%d %H:%M:%S"), user_id))
+
+    run_write(charge_maintenance)
     st.toast(f"Daily Maintenance Fee of :red[${format_number(fee)}] Applied.")
-    
-    conn.commit()
 
 def apply_monthly_living_tax(conn, user_id):
     c = conn.cursor()
@@ -735,24 +1297,26 @@ def apply_monthly_living_tax(conn, user_id):
     total_worth = calculate_total_worth(c, user_id)
     fee = total_worth * 0.05 * months_passed
 
-    c.execute("UPDATE users SET balance = balance - ? WHERE user_id = ?", (fee, user_id))
-    c.execute("UPDATE users SET balance = balance + ? WHERE username = 'Government'", (fee,))
-    
-    c.execute("INSERT INTO transactions (transaction_id, user_id, type, amount) VALUES (?, ?, ?, ?)", 
-              (random.randint(100000000000, 999999999999), user_id, "Monthly Living Tax", fee))
-
     new_tax_time = now.replace(day=1)  
-    c.execute("UPDATE users SET last_living_tax = ? WHERE user_id = ?", 
-              (new_tax_time.strftime("%Y-%m-%d %H:%M:%S"), user_id))
 
+    legs = [
+        charge_user(user_id, fee),
+        credit_treasury(fee),
+        record_transaction(user_id, "Monthly Living Tax", fee),
+    ]
+
+    def charge_living_tax(c):
+        apply_postings(c, legs)
+        c.execute("UPDATE users SET last_living_tax = ? WHERE user_id = ?", 
+                  (new_tax_time.strftime("%Y-%m-%d %H:%M:%S"), user_id))
+
+    run_write(charge_living_tax)
     st.toast(f"Monthly Living Tax of :red[${format_number(fee)}] Applied.")
-    
-    conn.commit()
 
 def register_user(conn, username, password):
     c = conn.cursor()
     try:
-        user_id_to_be_registered = random.randint(100000, 999999)
+        user_id_to_be_registered = next_id("users")
         hashed_password = hashPass(password)
                 
         with st.spinner("Creating your account..."):
@@ -884,22 +1448,6 @@ def init_db(conn):
                 FOREIGN KEY (user_id) REFERENCES users(user_id)
                 );''')
 
-    c.execute('''CREATE TABLE IF NOT EXISTS chats (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                message TEXT NOT NULL,
-                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(user_id)
-                );''')
-
-    c.execute('''CREATE TABLE IF NOT EXISTS chats2 (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                message TEXT NOT NULL,
-                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(user_id)
-                );''')
-
     c.execute('''CREATE TABLE IF NOT EXISTS stocks (
                 stock_id INTEGER PRIMARY KEY AUTOINCREMENT,
                 name TEXT NOT NULL,
@@ -1108,8 +1656,490 @@ def init_db(conn):
             );''')
     
     conn.commit()
+    apply_migrations(conn)
     return conn, c
 
+def column_exists(conn, table_name, column_name):
+    c = conn.cursor()
+    c.execute(f"PRAGMA table_info({table_name});")
+    columns = c.fetchall()
+    
+    return any(column[1] == column_name for column in columns)
+
+def add_column_if_not_exists(conn, table_name, column_name, column_type):
+    c = conn.cursor()
+    if not column_exists(conn, table_name, column_name):
+        alter_table_query = f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type};"
+        c.execute(alter_table_query)
+    else:
+        pass
+
+def migrate_hot_table_indexes(c):
+    c.execute("CREATE INDEX IF NOT EXISTS idx_transactions_user_time ON transactions (user_id, timestamp)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_transactions_receiver_status ON transactions (receiver_username, status)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_stock_history_stock_time ON stock_history (stock_id, timestamp)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_user_stocks_user_stock ON user_stocks (user_id, stock_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_user_properties_user ON user_properties (user_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_user_inventory_user_item ON user_inventory (user_id, item_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_real_estate_user ON real_estate (user_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_savings_user ON savings (user_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_interest_history_user_time ON interest_history (user_id, timestamp)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_investments_user_status ON investments (user_id, status)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_user_news_read_user ON user_news_read (user_id, news_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_employees_user ON employees (user_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_employees_company ON employees (company_id)")
+
+def copy_keeping_duplicate_ids(c, table, id_column, columns):
+    # The old tables had no key, so an id can repeat. The first row with an id keeps it and every later
+    # row (or one with no id) is inserted without it so INTEGER PRIMARY KEY assigns a fresh one; no row is dropped.
+    column_list = ", ".join(columns)
+    other_columns = ", ".join(column for column in columns if column != id_column)
+    keepers = f"SELECT MIN(rowid) FROM {table} WHERE {id_column} IS NOT NULL GROUP BY {id_column}"
+    c.execute(f"INSERT INTO {table}_new ({column_list}) SELECT {column_list} FROM {table} WHERE rowid IN ({keepers}) ORDER BY rowid")
+    c.execute(f"INSERT INTO {table}_new ({other_columns}) SELECT {other_columns} FROM {table} WHERE rowid NOT IN ({keepers}) ORDER BY rowid")
+    if c.rowcount > 0:
+        print(f"Migration gave {c.rowcount} {table} rows with a duplicate or missing {id_column} new ids")
+    c.execute(f"DROP TABLE {table}")
+    c.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+
+def migrate_missing_primary_keys(c):
+    # SQLite cannot add a primary key in place, so the three tables are rebuilt and swapped in.
+    # Rows that referenced a duplicated company_id keep pointing at the company that kept the id,
+    # since nothing in them says which of the duplicates was meant.
+    c.execute('''CREATE TABLE companies_new (
+            company_id INTEGER PRIMARY KEY,
+            owner_id INTEGER,
+            name TEXT,
+            description TEXT,
+            founded TEXT,
+            FOREIGN KEY (owner_id) REFERENCES users(user_id)
+            );''')
+    copy_keeping_duplicate_ids(c, "companies", "company_id", ("company_id", "owner_id", "name", "description", "founded"))
+    c.execute("CREATE INDEX IF NOT EXISTS idx_companies_owner ON companies (owner_id)")
+
+    c.execute('''CREATE TABLE job_posters_new (
+            job_poster_id INTEGER PRIMARY KEY,
+            job_title TEXT,
+            company_id INTEGER,
+            starting_wage REAL,
+            description TEXT,
+            FOREIGN KEY (company_id) REFERENCES companies(company_id)
+            );''')
+    copy_keeping_duplicate_ids(c, "job_posters", "job_poster_id", ("job_poster_id", "job_title", "company_id", "starting_wage", "description"))
+    c.execute("CREATE INDEX IF NOT EXISTS idx_job_posters_company ON job_posters (company_id)")
+
+    c.execute('''CREATE TABLE job_requests_new (
+            request_id INTEGER PRIMARY KEY,
+            user_id INTEGER,
+            company_id INTEGER,
+            FOREIGN KEY (user_id) REFERENCES users(user_id),
+            FOREIGN KEY (company_id) REFERENCES companies(company_id)
+            );''')
+    copy_keeping_duplicate_ids(c, "job_requests", "request_id", ("request_id", "user_id", "company_id"))
+    c.execute("CREATE INDEX IF NOT EXISTS idx_job_requests_company ON job_requests (company_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_job_requests_user ON job_requests (user_id)")
+
+def migrate_adhoc_columns(c):
+    add_column_if_not_exists(c.connection, "users", "last_maintenance_cost", "DATETIME")
+    add_column_if_not_exists(c.connection, "users", "last_living_tax", "DATETIME")
+    add_column_if_not_exists(c.connection, "users", "loan_duration", "INTEGER DEFAULT 0")
+    add_column_if_not_exists(c.connection, "users", "attack_level", "REAL DEFAULT 0")
+    add_column_if_not_exists(c.connection, "users", "defense_level", "REAL DEFAULT 0")
+    add_column_if_not_exists(c.connection, "user_properties", "last_collected", "TEXT DEFAULT NULL")
+
+ID_SEQUENCES = {
+    # name: (id column, first id for an empty table, ids reserved per block)
+    "transactions": ("transaction_id", 100000000000, 100),
+    "users": ("user_id", 100000, 1),
+    "news": ("news_id", 100000000, 1),
+    "quizzes": ("quiz_id", 100000000, 1),
+}
+
+def migrate_id_sequences(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS id_sequences (
+            name TEXT PRIMARY KEY NOT NULL,
+            next_id INTEGER NOT NULL
+            );''')
+    for name, (column, first_id, _) in ID_SEQUENCES.items():
+        c.execute(f"INSERT OR IGNORE INTO id_sequences (name, next_id) SELECT ?, MAX(COALESCE(MAX({column}), 0) + 1, ?) FROM {name}", (name, first_id))
+
+def migrate_scheduler_leases(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS scheduler_leases (
+            name TEXT PRIMARY KEY NOT NULL,
+            holder TEXT NOT NULL,
+            expires_at REAL NOT NULL
+            );''')
+
+def migrate_stock_candles(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS stock_candles (
+            stock_id INTEGER NOT NULL,
+            resolution INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            open REAL NOT NULL,
+            high REAL NOT NULL,
+            low REAL NOT NULL,
+            close REAL NOT NULL,
+            PRIMARY KEY (stock_id, resolution, bucket)
+            ) WITHOUT ROWID;''')
+    for resolution in CANDLE_RESOLUTIONS:
+        c.execute("""
+            INSERT OR REPLACE INTO stock_candles (stock_id, resolution, bucket, open, high, low, close)
+            SELECT stock_id, ?, bucket,
+                   MAX(CASE WHEN first_rank = 1 THEN price END), MAX(price), MIN(price),
+                   MAX(CASE WHEN last_rank = 1 THEN price END)
+            FROM (
+                SELECT stock_id, bucket, price,
+                       ROW_NUMBER() OVER (PARTITION BY stock_id, bucket ORDER BY timestamp ASC) AS first_rank,
+                       ROW_NUMBER() OVER (PARTITION BY stock_id, bucket ORDER BY timestamp DESC) AS last_rank
+                FROM (SELECT stock_id, price, timestamp, CAST(strftime('%s', timestamp) AS INTEGER) / ? * ? AS bucket FROM stock_history)
+            )
+            GROUP BY stock_id, bucket
+        """, (resolution, resolution, resolution))
+
+def migrate_stock_volume_index(c):
+    c.execute("CREATE INDEX IF NOT EXISTS idx_transactions_stock_time ON transactions (stock_id, timestamp)")
+
+NET_WORTH_EXPR = """
+    COALESCE(balance, 0)
+    + CASE WHEN has_savings_account THEN COALESCE((SELECT SUM(sv.balance) FROM savings sv WHERE sv.user_id = users.user_id), 0) ELSE 0 END
+    + COALESCE((SELECT SUM(re.price) FROM real_estate re WHERE re.user_id = users.user_id), 0)
+    + COALESCE((SELECT SUM(ucs.shares_owned / 100.0 * cl.total_worth) FROM user_country_shares ucs JOIN country_lands cl ON cl.country_id = ucs.country_id WHERE ucs.user_id = users.user_id), 0)
+    + COALESCE((SELECT SUM(us.quantity * s.price) FROM user_stocks us JOIN stocks s ON s.stock_id = us.stock_id WHERE us.user_id = users.user_id), 0)
+    - COALESCE(loan, 0)
+"""
+
+# Tables whose rows belong to one user: any change recomputes that user's net worth from scratch.
+NET_WORTH_HOLDINGS = {
+    "savings": "balance, user_id",
+    "real_estate": "price, user_id",
+    "user_country_shares": "shares_owned, user_id, country_id",
+    "user_stocks": "quantity, user_id, stock_id",
+}
+
+def migrate_net_worth(c):
+    add_column_if_not_exists(c.connection, "users", "net_worth", "REAL DEFAULT 0")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_users_net_worth ON users (net_worth)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_user_stocks_stock ON user_stocks (stock_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_user_country_shares_country ON user_country_shares (country_id)")
+
+    recompute = f"UPDATE users SET net_worth = {NET_WORTH_EXPR} WHERE user_id"
+    c.execute(f"CREATE TRIGGER IF NOT EXISTS trg_net_worth_users_insert AFTER INSERT ON users BEGIN {recompute} = NEW.user_id; END")
+    c.execute(f"CREATE TRIGGER IF NOT EXISTS trg_net_worth_users_update AFTER UPDATE OF balance, loan, has_savings_account ON users BEGIN {recompute} = NEW.user_id; END")
+    for table, columns in NET_WORTH_HOLDINGS.items():
+        c.execute(f"CREATE TRIGGER IF NOT EXISTS trg_net_worth_{table}_insert AFTER INSERT ON {table} BEGIN {recompute} = NEW.user_id; END")
+        c.execute(f"CREATE TRIGGER IF NOT EXISTS trg_net_worth_{table}_update AFTER UPDATE OF {columns} ON {table} BEGIN {recompute} IN (OLD.user_id, NEW.user_id); END")
+        c.execute(f"CREATE TRIGGER IF NOT EXISTS trg_net_worth_{table}_delete AFTER DELETE ON {table} BEGIN {recompute} = OLD.user_id; END")
+
+    # Price moves fan out to every holder, so they are applied as one set-based delta per stock or country.
+    c.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_net_worth_stock_price AFTER UPDATE OF price ON stocks
+        WHEN NEW.price IS NOT OLD.price
+        BEGIN
+            UPDATE users
+            SET net_worth = net_worth + (NEW.price - OLD.price) * (SELECT SUM(quantity) FROM user_stocks WHERE user_id = users.user_id AND stock_id = NEW.stock_id)
+            WHERE user_id IN (SELECT user_id FROM user_stocks WHERE stock_id = NEW.stock_id);
+        END
+    """)
+    c.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_net_worth_country_worth AFTER UPDATE OF total_worth ON country_lands
+        WHEN NEW.total_worth IS NOT OLD.total_worth
+        BEGIN
+            UPDATE users
+            SET net_worth = net_worth + (NEW.total_worth - OLD.total_worth) * (SELECT SUM(shares_owned) / 100.0 FROM user_country_shares WHERE user_id = users.user_id AND country_id = NEW.country_id)
+            WHERE user_id IN (SELECT user_id FROM user_country_shares WHERE country_id = NEW.country_id);
+        END
+    """)
+
+    c.execute(f"UPDATE users SET net_worth = {NET_WORTH_EXPR}")
+
+def migrate_rank_indexes(c):
+    c.execute("CREATE INDEX IF NOT EXISTS idx_users_vault_rank ON users (show_main_balance_on_leaderboard, balance)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_users_worth_rank ON users (show_main_balance_on_leaderboard, net_worth)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_savings_balance ON savings (balance)")
+
+def migrate_ledger_balances(c):
+    add_column_if_not_exists(c.connection, "transactions", "signed_amount", "REAL")
+    add_column_if_not_exists(c.connection, "transactions", "balance_after", "REAL")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_transactions_user_balance ON transactions (user_id, timestamp, balance_after)")
+
+    # Historical rows only have a type label, so classify them once and replay backwards from today's vault balance.
+    c.execute("""
+        UPDATE transactions SET signed_amount = CASE
+            WHEN type = 'Transfer to Vault' OR type LIKE 'Transfer Declined%' OR type LIKE 'Transfer Accepted%'
+                OR type LIKE 'Sell%' OR type LIKE 'Dividend%' OR type LIKE 'Collect%' OR type LIKE 'Borrow%'
+                OR type IN ('Investment Return', 'Investment Fail') THEN amount
+            WHEN type LIKE 'Buy%' OR type LIKE 'Upgrade%' OR type LIKE 'Repay%' OR type LIKE 'Transfer to%'
+                OR type LIKE 'Property Purchase%' OR type LIKE 'Membership%' OR type LIKE 'Investment Initiated%'
+                OR type IN ('Daily Fee', 'Monthly Living Tax') THEN -amount
+            ELSE 0
+        END
+        WHERE signed_amount IS NULL
+    """)
+    c.execute("""
+        WITH replay AS (
+            SELECT t.transaction_id, u.balance - COALESCE(SUM(t.signed_amount) OVER (
+                PARTITION BY t.user_id ORDER BY t.timestamp DESC, t.transaction_id DESC
+                ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+            ), 0) AS balance_after
+            FROM transactions t JOIN users u ON u.user_id = t.user_id
+        )
+        UPDATE transactions SET balance_after = replay.balance_after
+        FROM replay
+        WHERE transactions.transaction_id = replay.transaction_id AND transactions.balance_after IS NULL
+    """)
+
+def classify_transaction_rows(c, where="true"):
+    # SQL twin of classify_transaction; older rows may hold the text 'None' rather than NULL for "no receiver".
+    no_receiver = "(receiver_username IS NULL OR receiver_username = 'None')"
+    cases = " ".join(f"WHEN type = '{label}' AND {no_receiver} THEN '{name}'" for label, name in TRANSACTION_TYPE_LABELS.items())
+    cases += " " + " ".join(f"WHEN type LIKE '{prefix}%' THEN '{name}'" for prefix, name in TRANSACTION_TYPE_PREFIXES)
+    c.execute("CREATE TEMP TABLE transaction_type_map (name TEXT PRIMARY KEY, type_code INTEGER, direction INTEGER)")
+    c.executemany("INSERT INTO transaction_type_map VALUES (?, ?, ?)", [(name, type_code, direction) for name, (type_code, direction) in TRANSACTION_TYPES.items()])
+    c.execute(f"""
+        UPDATE transactions SET (type_code, direction) = (
+            SELECT type_code, direction FROM transaction_type_map
+            WHERE name = CASE {cases} ELSE 'other' END
+        )
+        WHERE {where}
+    """)
+    c.execute("DROP TABLE transaction_type_map")
+
+def migrate_transaction_types(c):
+    add_column_if_not_exists(c.connection, "transactions", "type_code", "INTEGER DEFAULT 0")
+    add_column_if_not_exists(c.connection, "transactions", "direction", "INTEGER DEFAULT 0")
+    classify_transaction_rows(c)
+
+    c.execute("CREATE INDEX IF NOT EXISTS idx_transactions_user_type ON transactions (user_id, type_code, timestamp, amount)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_transactions_type_time ON transactions (type_code, timestamp)")
+
+def migrate_net_worth_snapshots(c):
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS net_worth_snapshots (
+            user_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            balance REAL NOT NULL,
+            savings REAL NOT NULL,
+            stocks REAL NOT NULL,
+            properties REAL NOT NULL,
+            lands REAL NOT NULL,
+            loan REAL NOT NULL,
+            PRIMARY KEY (user_id, day)
+        ) WITHOUT ROWID
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_net_worth_snapshots_day ON net_worth_snapshots (day)")
+
+def migrate_activity_counters(c):
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS user_activity_hourly (
+            user_id INTEGER NOT NULL,
+            type_code INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            total REAL NOT NULL,
+            PRIMARY KEY (user_id, type_code, bucket)
+        ) WITHOUT ROWID
+    """)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS stock_activity_hourly (
+            stock_id INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            trades INTEGER NOT NULL,
+            volume INTEGER NOT NULL,
+            PRIMARY KEY (stock_id, bucket)
+        ) WITHOUT ROWID
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_stock_activity_hourly_bucket ON stock_activity_hourly (bucket)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_user_activity_hourly_bucket ON user_activity_hourly (bucket)")
+
+    c.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_user_activity_hourly AFTER INSERT ON transactions BEGIN
+            INSERT INTO user_activity_hourly (user_id, type_code, bucket, count, total)
+            VALUES (NEW.user_id, COALESCE(NEW.type_code, 0), {ACTIVITY_BUCKET_EXPR}, 1, COALESCE(NEW.amount, 0))
+            ON CONFLICT (user_id, type_code, bucket) DO UPDATE SET count = count + 1, total = total + excluded.total;
+        END
+    """)
+    c.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_stock_activity_hourly AFTER INSERT ON transactions WHEN NEW.stock_id != 0 BEGIN
+            INSERT INTO stock_activity_hourly (stock_id, bucket, trades, volume)
+            VALUES (NEW.stock_id, {ACTIVITY_BUCKET_EXPR}, 1, COALESCE(NEW.quantity, 0))
+            ON CONFLICT (stock_id, bucket) DO UPDATE SET trades = trades + 1, volume = volume + excluded.volume;
+        END
+    """)
+
+    backfill_bucket = ACTIVITY_BUCKET_EXPR.replace("NEW.", "")
+    since = int(time.time()) - ACTIVITY_RETENTION_SECONDS
+    c.execute(f"""
+        INSERT OR REPLACE INTO user_activity_hourly (user_id, type_code, bucket, count, total)
+        SELECT user_id, COALESCE(type_code, 0), {backfill_bucket} AS hour, COUNT(*), COALESCE(SUM(amount), 0)
+        FROM transactions
+        WHERE timestamp >= DATETIME(?, 'unixepoch')
+        GROUP BY user_id, COALESCE(type_code, 0), hour
+    """, (since,))
+    c.execute(f"""
+        INSERT OR REPLACE INTO stock_activity_hourly (stock_id, bucket, trades, volume)
+        SELECT stock_id, {backfill_bucket} AS hour, COUNT(*), COALESCE(SUM(quantity), 0)
+        FROM transactions
+        WHERE stock_id != 0 AND timestamp >= DATETIME(?, 'unixepoch')
+        GROUP BY stock_id, hour
+    """, (since,))
+
+def add_table_version_triggers(c, table):
+    c.execute("INSERT OR IGNORE INTO table_versions (name, version) VALUES (?, 0)", (table,))
+    bump = f"UPDATE table_versions SET version = version + 1 WHERE name = '{table}'"
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        c.execute(f"CREATE TRIGGER IF NOT EXISTS trg_version_{table}_{event.lower()} AFTER {event} ON {table} BEGIN {bump}; END")
+
+def migrate_table_versions(c):
+    c.execute("CREATE TABLE IF NOT EXISTS table_versions (name TEXT PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0)")
+    for table in ("country_lands", "investment_companies", "job_posters", "marketplace_items", "news", "quizzes", "stocks"):
+        add_table_version_triggers(c, table)
+
+CHAT_DEFAULT_CHANNELS = [
+    # channel_id, name, label, retention_days
+    (1, "english", "🌐 #ENGLISH", 7),
+    (2, "other", "💬 #OTHER", 7),
+]
+
+def migrate_chat_messages(c):
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS chat_channels (
+            channel_id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE,
+            label TEXT NOT NULL,
+            retention_days INTEGER NOT NULL DEFAULT 7
+        )
+    """)
+    c.executemany("INSERT OR IGNORE INTO chat_channels (channel_id, name, label, retention_days) VALUES (?, ?, ?, ?)", CHAT_DEFAULT_CHANNELS)
+    add_table_version_triggers(c, "chat_channels")
+
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS chat_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            channel_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            message TEXT NOT NULL,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (channel_id) REFERENCES chat_channels(channel_id),
+            FOREIGN KEY (user_id) REFERENCES users(user_id)
+        )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_chat_messages_channel ON chat_messages (channel_id, id)")
+
+    # Messages past their channel's retention, one zlib-compressed JSON chunk per channel and day.
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS chat_archive (
+            channel_id INTEGER NOT NULL,
+            first_id INTEGER NOT NULL,
+            last_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            message_count INTEGER NOT NULL,
+            payload BLOB NOT NULL,
+            PRIMARY KEY (channel_id, first_id)
+        ) WITHOUT ROWID
+    """)
+
+    for channel_id, table in ((1, "chats"), (2, "chats2")):
+        if c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone():
+            c.execute(f"INSERT INTO chat_messages (channel_id, user_id, message, timestamp) SELECT ?, user_id, message, timestamp FROM {table} ORDER BY id", (channel_id,))
+            c.execute(f"DROP TABLE {table}")
+
+SEARCH_INDEXES = {
+    # name: (fts table, content table, rowid column, indexed columns)
+    "chat": ("chat_messages_fts", "chat_messages", "id", ("message",)),
+    "transactions": ("transactions_fts", "transactions", "transaction_id", ("type", "receiver_username")),
+    "news": ("news_fts", "news", "news_id", ("title", "content")),
+}
+
+def create_search_index(c, fts, table, rowid, columns):
+    # External-content FTS5: the index stores only tokens and reads row text back from the content table.
+    column_list = ", ".join(columns)
+    new_values = ", ".join(f"new.{column}" for column in columns)
+    old_values = ", ".join(f"old.{column}" for column in columns)
+    c.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({column_list}, content='{table}', content_rowid='{rowid}', tokenize='unicode61 remove_diacritics 2')")
+    c.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{fts}_insert AFTER INSERT ON {table} BEGIN INSERT INTO {fts} (rowid, {column_list}) VALUES (new.{rowid}, {new_values}); END")
+    c.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{fts}_delete AFTER DELETE ON {table} BEGIN INSERT INTO {fts} ({fts}, rowid, {column_list}) VALUES ('delete', old.{rowid}, {old_values}); END")
+    c.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_{fts}_update AFTER UPDATE OF {column_list} ON {table} BEGIN
+            INSERT INTO {fts} ({fts}, rowid, {column_list}) VALUES ('delete', old.{rowid}, {old_values});
+            INSERT INTO {fts} (rowid, {column_list}) VALUES (new.{rowid}, {new_values});
+        END
+    """)
+    c.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+
+def migrate_search_indexes(c):
+    for name in ("chat", "transactions", "news"):
+        create_search_index(c, *SEARCH_INDEXES[name])
+
+def migrate_transfer_type_codes(c):
+    # Version 11 matched the savings/vault labels as prefixes, so transfers to e.g. "vaultking" were filed as vault moves.
+    classify_transaction_rows(c, "type LIKE 'Transfer%'")
+
+    # The hourly counters were keyed on the old codes, so rebuild the retained window from the ledger.
+    backfill_bucket = ACTIVITY_BUCKET_EXPR.replace("NEW.", "")
+    since = int(time.time()) - ACTIVITY_RETENTION_SECONDS
+    c.execute("DELETE FROM user_activity_hourly")
+    c.execute(f"""
+        INSERT INTO user_activity_hourly (user_id, type_code, bucket, count, total)
+        SELECT user_id, COALESCE(type_code, 0), {backfill_bucket} AS hour, COUNT(*), COALESCE(SUM(amount), 0)
+        FROM transactions
+        WHERE timestamp >= DATETIME(?, 'unixepoch')
+        GROUP BY user_id, COALESCE(type_code, 0), hour
+    """, (since,))
+
+SCHEMA_MIGRATIONS = [
+    (1, "Secondary indexes for hot tables", migrate_hot_table_indexes),
+    (2, "Primary keys for companies, job_posters and job_requests", migrate_missing_primary_keys),
+    (3, "Columns previously added ad hoc at startup", migrate_adhoc_columns),
+    (4, "Sequential id allocator", migrate_id_sequences),
+    (5, "Leases for background schedulers", migrate_scheduler_leases),
+    (6, "OHLC candle rollups for stock history", migrate_stock_candles),
+    (7, "Stock volume index on transactions", migrate_stock_volume_index),
+    (8, "Trigger-maintained users.net_worth", migrate_net_worth),
+    (9, "Indexes for rank probes", migrate_rank_indexes),
+    (10, "Signed amounts and running balances on the ledger", migrate_ledger_balances),
+    (11, "Transaction type codes and directions", migrate_transaction_types),
+    (12, "Daily net worth snapshots", migrate_net_worth_snapshots),
+    (13, "Hourly per-user and per-stock activity counters", migrate_activity_counters),
+    (14, "Version counters for cached reference tables", migrate_table_versions),
+    (15, "Channel-keyed chat store with archive", migrate_chat_messages),
+    (16, "Full-text search indexes", migrate_search_indexes),
+    (17, "Reclassify transfers to users named like savings/vault labels", migrate_transfer_type_codes),
+]
+
+SCHEMA_VERSION = SCHEMA_MIGRATIONS[-1][0]
+
+def get_schema_version(c):
+    return c.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+def apply_migrations(conn):
+    c = conn.cursor()
+    c.execute('''CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY NOT NULL,
+            description TEXT NOT NULL,
+            applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            );''')
+    conn.commit()
+
+    if get_schema_version(c) >= SCHEMA_VERSION:
+        return
+
+    for version, description, migrate in SCHEMA_MIGRATIONS:
+        # Every step runs in its own write transaction and re-checks the version under the lock,
+        # so two processes starting at once never apply the same step twice.
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            if get_schema_version(c) >= version:
+                conn.rollback()
+                continue
+            migrate(c)
+            c.execute("INSERT INTO schema_version (version, description) VALUES (?, ?)", (version, description))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    c.execute("PRAGMA optimize")
+
 def check_unread_news(conn, user_id):
     c = conn.cursor()
     unread_news = c.execute("""
@@ -1161,14 +2191,17 @@ def transfer_to_savings_dialog(conn, user_id):
     st.text("")
     if st.button("Transfer to Savings", type = "primary", use_container_width = True, disabled = True if net <= 0 or (current_balance - amount) < 0 or not has_savings else False, help = "Insufficent funds" if net <= 0 or (current_balance - net) < 0 else None):
         if check_cooldown(conn, user_id):
-            c.execute("UPDATE users SET balance = balance - ? WHERE user_id = ?", (amount, user_id))
-            c.execute("UPDATE savings SET balance = balance + ? WHERE user_id = ?", (net, user_id))
-            conn.commit()
-            new_savings_balance = c.execute("SELECT balance FROM savings WHERE user_id = ?", (user_id,)).fetchone()[0]
-            c.execute("INSERT INTO transactions (transaction_id, user_id, type, amount) VALUES (?, ?, ?, ?)", (random.randint(100000000000, 999999999999), user_id, "Transfer To Savings", net))
-            c.execute("UPDATE users SET balance = balance + ? WHERE username = 'Government'", (tax,))
-            conn.commit()
-            update_last_transaction_time(conn, user_id)
+            try:
+                post([
+                    debit_user(user_id, amount),
+                    credit_savings(user_id, net),
+                    credit_treasury(tax),
+                    record_transaction(user_id, "Transfer To Savings", net),
+                    stamp_user(user_id),
+                ])
+            except ValueError as e:
+                st.error(str(e))
+                return
             with st.spinner("Processing..."):
                 time.sleep(random.uniform(1, 2))
                 st.success(f"Successfully transferred ${format_number(net)}")
@@ -1218,13 +2251,18 @@ def transfer_dialog(conn, user_id):
                 current_balance = c.execute("SELECT balance FROM users WHERE user_id = ?", (user_id,)).fetchone()[0]
 
                 if amount <= current_balance:
-                    c.execute("UPDATE users SET balance = balance - ? WHERE user_id = ?", (amount, user_id))
-                    c.execute("INSERT INTO transactions (transaction_id, user_id, type, amount, receiver_username, status) VALUES (?, ?, ?, ?, ?, ?)", (random.randint(100000000000, 999999999999), user_id, f'Transfer to {receiver_username}', amount, receiver_username, 'Pending'))
-                    conn.commit()
+                    try:
+                        post([
+                            debit_user(user_id, amount),
+                            record_transaction(user_id, f'Transfer to {receiver_username}', amount, receiver_username, 'Pending'),
+                            stamp_user(user_id),
+                        ])
+                    except ValueError as e:
+                        st.error(str(e))
+                        return
                     with st.spinner("Processing"):
                         time.sleep(2)
                     st.success(f"Successfully initiated transfer of ${amount:.2f} to {receiver_username}. Awaiting acceptance.")
-                    update_last_transaction_time(conn, user_id)
                     time.sleep(1)
                     st.rerun()
                 else:
@@ -1267,14 +2305,17 @@ def transfer_to_vault_dialog(conn, user_id):
 
     if st.button("Transfer", type = "primary", use_container_width = True, disabled = True if amount <= 0.00 else False):
         if check_cooldown(conn, user_id):
-            c.execute("UPDATE users SET balance = balance + ? WHERE user_id = ?", (net, user_id))
-            c.execute("UPDATE savings SET balance = balance - ? WHERE user_id = ?", (amount, user_id))
-
-            c.execute("INSERT INTO transactions (transaction_id, user_id, type, amount) VALUES (?, ?, ?, ?)", (random.randint(100000000000, 999999999999), user_id, f"Transfer to Vault", net))
-            c.execute("UPDATE users SET balance = balance + ? WHERE username = 'Government'", (tax,))
-            conn.commit()
-
-            update_last_transaction_time(conn, user_id)
+            try:
+                post([
+                    debit_savings(user_id, amount),
+                    credit_user(user_id, net),
+                    credit_treasury(tax),
+                    record_transaction(user_id, f"Transfer to Vault", net),
+                    stamp_user(user_id),
+                ])
+            except ValueError as e:
+                st.error(str(e))
+                return
             with st.spinner("Processing..."):
                 time.sleep(random.uniform(1, 2))
             st.success(f"Successfully transferred ${format_number(net)} to vault.")
@@ -1288,7 +2329,7 @@ def transfer_to_vault_dialog(conn, user_id):
 def item_options(conn, user_id, item_id):
     c = conn.cursor()
     owned_item_ids = [item_id[0] for item_id in c.execute("SELECT item_id FROM user_inventory WHERE user_id = ?", (user_id,)).fetchall()]
-    item_data = c.execute("SELECT name, description, rarity, price, stock, image_url FROM marketplace_items WHERE item_id = ?", (item_id,)).fetchall()[0]
+    item_data = get_reference(c, "marketplace_items")["by_id"][item_id][1:]
     balance = c.execute("SELECT balance FROM users WHERE user_id = ?", (user_id,)).fetchone()[0]
     st.header(f"{item_colors[item_data[2]]}[{item_data[0]}] :gray[  **•**   {item_data[2].upper()}]", divider = "rainbow")
     st.text("")
@@ -1322,10 +2363,15 @@ def gift_prop_dialog(conn, user_id, prop_id):
     if st.button("Confirm Gift Property", use_container_width=True, type="primary"):
         with st.spinner("Sending gift..."):
             rent_i = c.execute("SELECT rent_income FROM real_estate WHERE property_id = ?", (prop_id,)).fetchone()[0]
-            c.execute("DELETE FROM user_properties WHERE property_id = ? AND user_id = ?", (prop_id, user_id))
-            c.execute("INSERT INTO user_properties (user_id, property_id, purchase_date, rent_income, level) VALUES (?, ?, ?, ?, ?)", (chosen_id, prop_id, datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"), rent_i, prop_level))
-            c.execute("UPDATE real_estate SET username = ? WHERE property_id = ?", (chosen, prop_id))
-            c.execute("INSERT INTO transactions (transaction_id, user_id, type, amount, receiver_username) VALUES (?, ?, ?, ?, ?)", (random.randint(100000000000, 999999999999), user_id, f"Gift Property ID {prop_id}", 0.00, chosen))
+            legs = [record_transaction(user_id, f"Gift Property ID {prop_id}", 0.00, chosen)]
+
+            def hand_over_property(c):
+                c.execute("DELETE FROM user_properties WHERE property_id = ? AND user_id = ?", (prop_id, user_id))
+                c.execute("INSERT INTO user_properties (user_id, property_id, purchase_date, rent_income, level) VALUES (?, ?, ?, ?, ?)", (chosen_id, prop_id, datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"), rent_i, prop_level))
+                c.execute("UPDATE real_estate SET username = ? WHERE property_id = ?", (chosen, prop_id))
+                apply_postings(c, legs)
+
+            run_write(hand_over_property)
         st.success("Gift was sent successfully!")
         time.sleep(2)
         st.rerun()
@@ -1475,7 +2521,7 @@ def country_details_dialog(conn, user_id, country_id):
 @st.dialog("News & Events & Announcements")
 def news_dialog(conn, user_id):
     c = conn.cursor()
-    news_data = c.execute("SELECT news_id, title, content, likes, dislikes, created, category FROM news ORDER BY created DESC").fetchall()
+    news_data = get_reference(c, "news")["rows"]
     tab1, tab2, tab3 = st.tabs(["📢 Announcements", "⏳ Events", "🌍 Global News"])
 
     def handle_like_dislike(news_id, action):
@@ -1527,12 +2573,7 @@ def news_dialog(conn, user_id):
 def quiz_dialog_view(conn, user_id):
     c = conn.cursor()
 
-    quiz = c.execute("""
-        SELECT quiz_id, question, option_a, option_b, option_c, option_d, correct_option, quiz_type, cash_prize
-        FROM quizzes
-        ORDER BY date_added DESC
-        LIMIT 1
-    """).fetchone()
+    quiz = next(iter(get_reference(c, "latest_quiz")["rows"]), None)
 
     if not quiz:
         st.warning("No quiz available yet. Check back next Monday!")
@@ -1697,18 +2738,21 @@ def privacy_policy_dialog():
     if st.button("I accept privacy policy", type = "primary", use_container_width = True, disabled = True if not constent else False):
         st.rerun()
 
+CHAT_REFRESH_SECONDS = 5
+PORTFOLIO_REFRESH_SECONDS = 30
+
+def lazy_tabs(labels, key):
+    # Unlike st.tabs, only the selected pane's body runs on a rerun; the others load when picked.
+    selected = st.segmented_control("Tab", labels, default=labels[0], required=True, key=key, label_visibility="collapsed", width="stretch")
+    return labels.index(selected) if selected in labels else 0
+
 def leaderboard(c):
     st.header("Ranking", divider="rainbow")
     st.text("")
-    tab1, tab2, tab3 = st.tabs(["💰 VAULT", "🏦 SAVINGS", "🌎 TOTAL WORTH"])
+    tab = lazy_tabs(["💰 VAULT", "🏦 SAVINGS", "🌎 TOTAL WORTH"], key="leaderboard_tab")
 
     st.markdown('''
         <style>
-            button[data-baseweb="tab"] {
-                font-size: 24px;
-                margin: 0;
-                width: 100%;
-            }
             .leaderboard-frame {
                 border-radius: 10px;
                 padding: 10px;
@@ -1767,33 +2811,22 @@ def leaderboard(c):
         </style>
     ''', unsafe_allow_html=True)
 
-    balance_data = c.execute("""
-        SELECT username, visible_name, balance 
-        FROM users 
-        WHERE show_main_balance_on_leaderboard = 1 
-        ORDER BY balance DESC
-    """).fetchall()
+    version = get_leaderboard_version(c)
 
-    savings_balance_data = c.execute("""
-        SELECT u.username, u.visible_name, IFNULL(s.balance, 0) AS savings_balance 
-        FROM users u 
-        LEFT JOIN savings s ON u.user_id = s.user_id 
-        WHERE u.show_savings_balance_on_leaderboard = 1 
-        ORDER BY savings_balance DESC
-    """).fetchall()
+    def display_leaderboard(metric):
+        data = load_leaderboard(metric, version)
+        own_rank = get_user_rank(c, st.session_state.user_id, metric)
+        if own_rank:
+            st.caption(f"You are :orange[#{own_rank['rank']}] with :green[${format_number(own_rank['score'])}]")
+        pages = max(1, -(-len(data) // LEADERBOARD_PAGE_SIZE))
+        page = 1
+        if pages > 1:
+            page = st.segmented_control("Page", options=list(range(1, pages + 1)), default=1, key=f"leaderboard_page_{metric}", label_visibility="collapsed") or 1
+        first = (page - 1) * LEADERBOARD_PAGE_SIZE
 
-    total_worth_data = []
-    users = c.execute("SELECT user_id, username, visible_name FROM users WHERE show_main_balance_on_leaderboard = 1").fetchall()
-    for user_id, username, visible_name in users:
-        total_worth = calculate_total_worth(c, user_id)
-        total_worth_data.append((username, visible_name, total_worth))
-    
-    total_worth_data.sort(key=lambda x: x[2], reverse=True)
-    
-    def display_leaderboard(data):
         medals = ["🥇", "🥈", "🥉"]
 
-        for idx, (username, visible_name, score) in enumerate(data, start=1):
+        for idx, (username, visible_name, score) in enumerate(data[first:first + LEADERBOARD_PAGE_SIZE], start=first + 1):
             display_name = visible_name or username
             medal = medals[idx - 1] if idx <= 3 else ""
             class_name = "first" if idx == 1 else "second" if idx == 2 else "third" if idx == 3 else "other"
@@ -1810,15 +2843,56 @@ def leaderboard(c):
                 unsafe_allow_html=True,
             )
 
-    with tab1:
-        display_leaderboard(balance_data)
+    if tab == 0:
+        display_leaderboard("vault")
 
-    with tab2:
-        display_leaderboard(savings_balance_data)
+    if tab == 1:
+        display_leaderboard("savings")
 
-    with tab3:
-        display_leaderboard(total_worth_data)
+    if tab == 2:
+        display_leaderboard("worth")
+
+
+LEADERBOARD_TOP_K = 100
+LEADERBOARD_PAGE_SIZE = 25
+LEADERBOARD_TTL_SECONDS = 30
+
+LEADERBOARD_QUERIES = {
+    "vault": """
+        SELECT username, visible_name, balance 
+        FROM users 
+        WHERE show_main_balance_on_leaderboard = 1 
+        ORDER BY balance DESC
+        LIMIT ?
+    """,
+    "savings": """
+        SELECT u.username, u.visible_name, IFNULL(s.balance, 0) AS savings_balance 
+        FROM users u 
+        LEFT JOIN savings s ON u.user_id = s.user_id 
+        WHERE u.show_savings_balance_on_leaderboard = 1 
+        ORDER BY savings_balance DESC
+        LIMIT ?
+    """,
+    "worth": """
+        SELECT username, visible_name, MAX(0, net_worth) 
+        FROM users 
+        WHERE show_main_balance_on_leaderboard = 1 
+        ORDER BY net_worth DESC
+        LIMIT ?
+    """,
+}
 
+def get_leaderboard_version(c):
+    # Balances move together with a transaction row, and net worth also moves with every market tick.
+    return c.execute("SELECT (SELECT MAX(transaction_id) FROM transactions), (SELECT COUNT(*) FROM users), (SELECT MAX(last_updated) FROM stocks)").fetchone()
+
+@st.cache_data(ttl=LEADERBOARD_TTL_SECONDS, show_spinner=False, max_entries=12)
+def load_leaderboard(metric, version):
+    read_conn = open_read_connection()
+    try:
+        return read_conn.execute(LEADERBOARD_QUERIES[metric], (LEADERBOARD_TOP_K,)).fetchall()
+    finally:
+        read_conn.close()
 
 @st.dialog("Item Options")
 def inventory_item_options(conn, user_id, item_id):
@@ -1835,8 +2909,13 @@ def inventory_item_options(conn, user_id, item_id):
     new_price = c1.number_input("a", label_visibility="collapsed", min_value=0, step=200, placeholder="Price")
     if c2.button("**Put on BlackMarket**", use_container_width=True):
         with st.spinner("Processing..."):
-            c.execute("INSERT INTO blackmarket_items (item_id, item_number, name, description, rarity, price, image_url, seller_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", (item_id, item_number, item_data[0], item_data[1], item_data[2], new_price, item_data[4], user_id))
-            c.execute("INSERT INTO transactions (transaction_id, user_id, type, amount) VALUES (?, ?, ?, ?)", (random.randint(100000000000, 999999999999), user_id, f"Put GNFT {item_data[0]} (ID {item_id}) on BlackMarket", 0.00))
+            legs = [record_transaction(user_id, f"Put GNFT {item_data[0]} (ID {item_id}) on BlackMarket", 0.00)]
+
+            def list_on_blackmarket(c):
+                c.execute("INSERT INTO blackmarket_items (item_id, item_number, name, description, rarity, price, image_url, seller_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", (item_id, item_number, item_data[0], item_data[1], item_data[2], new_price, item_data[4], user_id))
+                apply_postings(c, legs)
+
+            run_write(list_on_blackmarket)
             time.sleep(3)
         st.success("Item is now for sale on blackmarket!")
         time.sleep(2)
@@ -1850,18 +2929,20 @@ def inventory_item_options(conn, user_id, item_id):
     receiver_id = c.execute("SELECT user_id FROM users WHERE username = ?", (user_to_gift,)).fetchone()[0]
     if st.button("Send Gift", use_container_width=True):
         with st.spinner("Gifting NFT..."):
-            c.execute("DELETE FROM user_inventory WHERE item_id = ?", (item_id,))
-            c.execute("INSERT INTO user_inventory (user_id, item_id, item_number) VALUES (?, ?, ?)", (receiver_id, item_id, item_number))
-            c.execute("INSERT INTO transactions (transaction_id, user_id, type, amount, receiver_username) VALUES (?, ?, ?, ?, ?)", (random.randint(100000000000, 999999999999), user_id, f"Gift GNFT ID {item_data[0]}", 0.00, user_to_gift))
-            if item_data[3] == "interest_boost":
-                c.execute("UPDATE savings SET interest_rate = interest_rate - ? WHERE user_id = ?", (item_data[4], receiver_id))
-                conn.commit()
-            if item_data[3] == "attack_boost":
-                c.execute("UPDATE users SET attack_level = attack_level - ? WHERE user_id = ?", (item_data[4], receiver_id))
-                conn.commit()
-            if item_data[3] == "defense_boost":
-                c.execute("UPDATE users SET defense_level = defense_level - ? WHERE user_id = ?", (item_data[4], receiver_id))
-                conn.commit()
+            legs = [record_transaction(user_id, f"Gift GNFT ID {item_data[0]}", 0.00, user_to_gift)]
+
+            def hand_over_item(c):
+                c.execute("DELETE FROM user_inventory WHERE item_id = ?", (item_id,))
+                c.execute("INSERT INTO user_inventory (user_id, item_id, item_number) VALUES (?, ?, ?)", (receiver_id, item_id, item_number))
+                apply_postings(c, legs)
+                if item_data[3] == "interest_boost":
+                    c.execute("UPDATE savings SET interest_rate = interest_rate - ? WHERE user_id = ?", (item_data[4], receiver_id))
+                if item_data[3] == "attack_boost":
+                    c.execute("UPDATE users SET attack_level = attack_level - ? WHERE user_id = ?", (item_data[4], receiver_id))
+                if item_data[3] == "defense_boost":
+                    c.execute("UPDATE users SET defense_level = defense_level - ? WHERE user_id = ?", (item_data[4], receiver_id))
+
+            run_write(hand_over_item)
             time.sleep(2.5)
         st.success("Success!")
         time.sleep(1)
@@ -1897,10 +2978,20 @@ def upgrade_prop_dialog(conn, user_id, prop_id):
     st.title(f"**COST**  :red[${format_number(user_prop[0] * user_prop[1] * 5)}]" if user_prop[0] != 10 else ":red[$∞]")
     if st.button("**Confirm Upgrade**", type="primary", use_container_width=True, disabled=True if balance < (user_prop[0] * user_prop[1] * 5) or user_prop[0] == 10 else False):
         with st.spinner("🔨 Processing upgrade..."):
-            c.execute("UPDATE users SET balance = balance - ? WHERE user_id = ?", (user_prop[0] * user_prop[1] * 5, user_id))
-            c.execute("UPDATE user_properties SET rent_income = ?, level = level + 1 WHERE property_id = ?", (user_prop[1] * 3.5, prop_id))
-            c.execute("INSERT INTO transactions (transaction_id, user_id, type, amount) VALUES (?, ?, ?, ?)", (random.randint(100000000000, 999999999999), user_id, f"Upgrade Property {prop} to Level {user_prop[0] + 1}", user_prop[0] * user_prop[1] * 5))
-            conn.commit()
+            legs = [
+                debit_user(user_id, user_prop[0] * user_prop[1] * 5),
+                record_transaction(user_id, f"Upgrade Property {prop} to Level {user_prop[0] + 1}", user_prop[0] * user_prop[1] * 5),
+            ]
+
+            def upgrade_property(c):
+                apply_postings(c, legs)
+                c.execute("UPDATE user_properties SET rent_income = ?, level = level + 1 WHERE property_id = ?", (user_prop[1] * 3.5, prop_id))
+
+            try:
+                run_write(upgrade_property)
+            except ValueError as e:
+                st.error(str(e))
+                return
             time.sleep(3)
         st.success(f"Upgraded {prop} to level :orange[{user_prop[0] + 1}]!")
         time.sleep(1.5)
@@ -1916,22 +3007,30 @@ def buy_item(conn, user_id, item_id):
         
     if stock != 0:
         with st.spinner("Purchasing..."):
-            next_item_number = c.execute("""
-                SELECT COALESCE(MAX(item_number), 0) + 1 
-                FROM user_inventory 
-                WHERE item_id = ?
-            """, (item_id,)).fetchone()[0]
-            c.execute("UPDATE users SET balance = balance - ? WHERE user_id = ?", (price, user_id))
-            c.execute("UPDATE users SET balance = balance + ? WHERE username = 'Government'", (price,))
-            c.execute("INSERT INTO user_inventory (user_id, item_id, item_number) VALUES (?, ?, ?)", (user_id, item_id, next_item_number))
-            c.execute("UPDATE marketplace_items SET stock = stock - 1 WHERE item_id = ?", (item_id,))
-            c.execute("INSERT INTO transactions (transaction_id, user_id, type, amount) VALUES (?, ?, ?, ?)", (random.randint(100000000000, 999999999999), user_id, f"Buy GNFT ID {item_id}", price))
-            conn.commit()
-
-            if item_data[3] == "interest_boost":
-                c.execute("UPDATE savings SET interest_rate = interest_rate + ? WHERE user_id = ?", (item_data[4], user_id))
-                conn.commit()
+            legs = [
+                debit_user(user_id, price),
+                credit_treasury(price),
+                record_transaction(user_id, f"Buy GNFT ID {item_id}", price),
+            ]
+
+            def purchase_item(c):
+                next_item_number = c.execute("""
+                    SELECT COALESCE(MAX(item_number), 0) + 1 
+                    FROM user_inventory 
+                    WHERE item_id = ?
+                """, (item_id,)).fetchone()[0]
+                apply_postings(c, legs)
+                c.execute("INSERT INTO user_inventory (user_id, item_id, item_number) VALUES (?, ?, ?)", (user_id, item_id, next_item_number))
+                c.execute("UPDATE marketplace_items SET stock = stock - 1 WHERE item_id = ?", (item_id,))
+
+                if item_data[3] == "interest_boost":
+                    c.execute("UPDATE savings SET interest_rate = interest_rate + ? WHERE user_id = ?", (item_data[4], user_id))
 
+            try:
+                run_write(purchase_item)
+            except ValueError as e:
+                st.error(str(e))
+                return
             time.sleep(1.5)
         st.success(f"Item purchased!")
         time.sleep(1)
@@ -1942,7 +3041,7 @@ def buy_item(conn, user_id, item_id):
 def marketplace_view(conn, user_id):
     c = conn.cursor()
 
-    items = c.execute("SELECT item_id, name, description, rarity, price, stock, image_url FROM marketplace_items").fetchall()
+    items = get_reference(c, "marketplace_items")["rows"]
     st.markdown("<h1 style='font-family: Inter;'>GNFTs</h1>", unsafe_allow_html=True)
     st.divider()
 
@@ -1969,23 +3068,9 @@ def marketplace_view(conn, user_id):
 def inventory_view(conn, user_id):
     c = conn.cursor()
 
-    user_stocks = c.execute("""
-            SELECT us.stock_id, s.name, s.symbol, us.quantity, us.avg_buy_price, s.price 
-            FROM user_stocks us
-            JOIN stocks s ON us.stock_id = s.stock_id
-            WHERE us.user_id = ? AND us.quantity > 0
-        """, (user_id,)).fetchall()
+    tab = lazy_tabs(["💠 GNFTs", "🏠 Properties", "📈 Stocks"], key="inventory_tab")
 
-    owned_properties = c.execute("""
-            SELECT up.property_id, re.region, re.type, re.image_url, up.rent_income, up.last_collected, up.purchase_date, up.level
-            FROM user_properties up
-            JOIN real_estate re ON up.property_id = re.property_id
-            WHERE up.user_id = ?
-        """, (user_id,)).fetchall()
-
-    t1, t2, t3 = st.tabs(["💠 GNFTs", "🏠 Properties", "📈 Stocks"])
-
-    with t1:
+    if tab == 0:
         owned_item_ids = [owned_item[0] for owned_item in c.execute("SELECT item_id FROM user_inventory WHERE user_id = ?", (user_id,)).fetchall()]
         if not owned_item_ids:
             st.write("No items in your inventory.")
@@ -1995,7 +3080,9 @@ def inventory_view(conn, user_id):
             st.header("Your GNFTs", divider="rainbow")
             
             for idx, item_id in enumerate(owned_item_ids):
-                item_details = c.execute("SELECT name, description, rarity, image_url FROM marketplace_items WHERE item_id = ?", (item_id,)).fetchone()
+                item_details = get_reference(c, "marketplace_items")["by_id"].get(item_id)
+                if item_details is not None:
+                    item_details = item_details[1:4] + item_details[6:7]
 
                 if item_details is None:
                     st.error(f"Item with ID {item_id} not found in the marketplace.")
@@ -2024,7 +3111,14 @@ def inventory_view(conn, user_id):
                 
                 st.divider()
 
-    with t2:
+    if tab == 1:
+        owned_properties = c.execute("""
+                SELECT up.property_id, re.region, re.type, re.image_url, up.rent_income, up.last_collected, up.purchase_date, up.level
+                FROM user_properties up
+                JOIN real_estate re ON up.property_id = re.property_id
+                WHERE up.user_id = ?
+            """, (user_id,)).fetchall()
+
         st.text("")
         st.text("")
         st.header("🏡 My Properties", divider="rainbow")
@@ -2084,10 +3178,14 @@ def inventory_view(conn, user_id):
 
                     if c1.button("Sell", key=f"sell_{prop_id}", use_container_width=True):
                         with st.spinner("Selling..."):
-                            c.execute("DELETE FROM user_properties WHERE property_id = ?", (prop_id,))
-                            c.execute("UPDATE real_estate SET sold = 0, is_owned = 0, username = NULL, user_id = 0 WHERE property_id = ?", (prop_id,))
-                            c.execute("INSERT INTO transactions (transaction_id, user_id, type, amount) VALUES (?, ?, ?, ?)", (random.randint(100000000000, 999999999999), user_id, f"Sell Property {type}", (rent_income / 100) * 25))
-                            conn.commit()
+                            legs = [record_transaction(user_id, f"Sell Property {type}", (rent_income / 100) * 25)]
+
+                            def release_property(c):
+                                c.execute("DELETE FROM user_properties WHERE property_id = ?", (prop_id,))
+                                c.execute("UPDATE real_estate SET sold = 0, is_owned = 0, username = NULL, user_id = 0 WHERE property_id = ?", (prop_id,))
+                                apply_postings(c, legs)
+
+                            run_write(release_property)
                             time.sleep(3)
                         st.success("Sold property to the bank for 25% of its value.")
                         st.rerun()
@@ -2099,67 +3197,83 @@ def inventory_view(conn, user_id):
                         upgrade_prop_dialog(conn, user_id, prop_id)
 
                     if c4.button("**COLLECT RENT**", type="primary", key=f"rent_{prop_id}", use_container_width=True, disabled=not can_collect, help="Rent for this property has already been collected today." if not can_collect else None):
-                        c.execute("UPDATE users SET balance = balance + ? WHERE user_id = ?", (rent_income, user_id))
-                        c.execute("UPDATE user_properties SET last_collected = ? WHERE property_id = ?", (now.strftime("%Y-%m-%d %H:%M:%S"), prop_id))
-                        c.execute("INSERT INTO transactions (transaction_id, user_id, type, amount) VALUES (?, ?, ?, ?)", (random.randint(100000000000, 999999999999), user_id, f"Collect Rent from {prop_type}", rent_income))
-                        conn.commit()
+                        legs = [
+                            credit_user(user_id, rent_income),
+                            record_transaction(user_id, f"Collect Rent from {prop_type}", rent_income),
+                        ]
+
+                        def pay_rent(c):
+                            apply_postings(c, legs)
+                            c.execute("UPDATE user_properties SET last_collected = ? WHERE property_id = ?", (now.strftime("%Y-%m-%d %H:%M:%S"), prop_id))
+
+                        run_write(pay_rent)
                         st.toast(f"🎉 Collected :green[${format_number(rent_income)}]!")
                         time.sleep(0.5)
                         st.rerun()
 
-    with t3:
-        st_autorefresh(interval=30000, key="ss")
-        update_stock_prices(conn)
-        st.header("📊 My Portfolio", divider="rainbow")
+    if tab == 2:
+        @st.fragment(run_every=PORTFOLIO_REFRESH_SECONDS)
+        def portfolio():
+            user_stocks = c.execute("""
+                    SELECT us.stock_id, s.name, s.symbol, us.quantity, us.avg_buy_price, s.price 
+                    FROM user_stocks us
+                    JOIN stocks s ON us.stock_id = s.stock_id
+                    WHERE us.user_id = ? AND us.quantity > 0
+                """, (user_id,)).fetchall()
 
-        if not user_stocks:
-            st.info("You do not hold any stocks. Start trading now!")
+            st.header("📊 My Portfolio", divider="rainbow")
+
+            if not user_stocks:
+                st.info("You do not hold any stocks. Start trading now!")
         
-        st.text("")
-        st.text("")
+            st.text("")
+            st.text("")
 
-        for stock_id, name, symbol, quantity, avg_buy_price, current_price in user_stocks:
-            stock_worth = quantity * current_price
-            st.session_state.portofolio_value = stock_worth
-            profit_loss = (current_price - avg_buy_price) * quantity
-            profit_loss_percent = ((current_price - avg_buy_price) / avg_buy_price) * 100 if avg_buy_price > 0 else 0
+            for stock_id, name, symbol, quantity, avg_buy_price, current_price in user_stocks:
+                stock_worth = quantity * current_price
+                st.session_state.portofolio_value = stock_worth
+                profit_loss = (current_price - avg_buy_price) * quantity
+                profit_loss_percent = ((current_price - avg_buy_price) / avg_buy_price) * 100 if avg_buy_price > 0 else 0
 
-            st.subheader(f"{name} ({symbol})")
+                st.subheader(f"{name} ({symbol})")
 
-            with st.container(border=True):  
-                c1, c2, c3, c4, c5 = st.columns([2,2,2,2,3])
+                with st.container(border=True):  
+                    c1, c2, c3, c4, c5 = st.columns([2,2,2,2,3])
 
-                with c1:
-                    st.write("Holding")
-                    st.write(f":blue[{format_number(quantity)}]")
+                    with c1:
+                        st.write("Holding")
+                        st.write(f":blue[{format_number(quantity)}]")
 
-                with c2:
-                    st.write("AVG Buy Price")
-                    st.write(f":red[{format_number(avg_buy_price)}]")
+                    with c2:
+                        st.write("AVG Buy Price")
+                        st.write(f":red[{format_number(avg_buy_price)}]")
 
-                with c3:
-                    st.write("Current Price")
-                    st.write(f":green[{format_number(current_price)}]")
+                    with c3:
+                        st.write("Current Price")
+                        st.write(f":green[{format_number(current_price)}]")
 
-                with c4:
-                    st.write("Total Worth")
-                    st.write(f":green[{format_number(stock_worth)}]")
+                    with c4:
+                        st.write("Total Worth")
+                        st.write(f":green[{format_number(stock_worth)}]")
 
-                with c5:
-                    st.write("Gain / Loss")
-                    if profit_loss < 0:
-                        st.subheader(f":red[{format_number(profit_loss)}]")
-                        st.caption(f":red[{format_number(profit_loss_percent)}%]")
-                    else:
-                        st.subheader(f":green[{format_number(profit_loss)}]")
-                        st.caption(f":green[+{format_number(profit_loss_percent)}%]")
+                    with c5:
+                        st.write("Gain / Loss")
+                        if profit_loss < 0:
+                            st.subheader(f":red[{format_number(profit_loss)}]")
+                            st.caption(f":red[{format_number(profit_loss_percent)}%]")
+                        else:
+                            st.subheader(f":green[{format_number(profit_loss)}]")
+                            st.caption(f":green[+{format_number(profit_loss_percent)}%]")
                 
-            if st.button("Quick Sell (ALL)", use_container_width = True, key = stock_id):
-                with st.spinner("Processing..."):
-                    sell_stock(conn, user_id, stock_id, quantity)
-                    time.sleep(2)
+                if st.button("Quick Sell (ALL)", use_container_width = True, key = stock_id):
+                    with st.spinner("Processing..."):
+                        sell_stock(conn, user_id, stock_id, quantity)
+                        time.sleep(2)
+                    st.rerun()
         
-            st.divider()
+                st.divider()
+
+        portfolio()
 
 def manage_pending_transfers(conn, receiver_id):
     c = conn.cursor()
@@ -2193,11 +3307,18 @@ def manage_pending_transfers(conn, receiver_id):
 
         if c1.button(f"Accept", type = "primary", use_container_width = True, key = transaction_id):
             with st.spinner("Accepting Transfer"):
-                c.execute("UPDATE transactions SET status = 'Accepted' WHERE transaction_id = ?", (transaction_id,))
-                c.execute("UPDATE users SET balance = balance + ? WHERE user_id = ?", (net, receiver_id))
-                c.execute("UPDATE users SET balance = balance + ? WHERE username = 'Government'", (tax,))
-                c.execute("INSERT INTO transactions (transaction_id, user_id, type, amount, receiver_username) VALUES (?, ?, ?, ?, ?)", (random.randint(100000000000, 999999999999), receiver_id, f"Transfer Accepted", amount, sender_username))
-                conn.commit()
+                legs = [
+                    credit_user(receiver_id, net),
+                    credit_treasury(tax),
+                    record_transaction(receiver_id, f"Transfer Accepted", amount, sender_username),
+                ]
+
+                def accept_transfer(c):
+                    if c.execute("UPDATE transactions SET status = 'Accepted' WHERE transaction_id = ? AND status = 'Pending'", (transaction_id,)).rowcount == 0:
+                        return
+                    apply_postings(c, legs)
+
+                run_write(accept_transfer)
                 time.sleep(2)
             st.toast("Transfer accepted!")
             time.sleep(2)
@@ -2205,10 +3326,17 @@ def manage_pending_transfers(conn, receiver_id):
 
         if c2.button(f"Decline", use_container_width = True, key = transaction_id + 1):
             with st.spinner("Declining Transfer"):
-                c.execute("UPDATE transactions SET status = 'Rejected' WHERE transaction_id = ?", (transaction_id,))
-                c.execute("UPDATE users SET balance = balance + ? WHERE user_id = ?", (amount, sender_id))
-                c.execute("INSERT INTO transactions (transaction_id, user_id, type, amount, receiver_username) VALUES (?, ?, ?, ?, ?)", (random.randint(100000000000, 999999999999), sender_id, f"Transfer Declined", amount, receiver_id))
-                conn.commit()
+                legs = [
+                    credit_user(sender_id, amount),
+                    record_transaction(sender_id, f"Transfer Declined", amount, receiver_id),
+                ]
+
+                def decline_transfer(c):
+                    if c.execute("UPDATE transactions SET status = 'Rejected' WHERE transaction_id = ? AND status = 'Pending'", (transaction_id,)).rowcount == 0:
+                        return
+                    apply_postings(c, legs)
+
+                run_write(decline_transfer)
                 time.sleep(2)
             st.toast("Transfer declined!")
             time.sleep(2)
@@ -2221,7 +3349,7 @@ def manage_pending_transfers(conn, receiver_id):
 def main_account_view(conn, user_id):
     c = conn.cursor()
 
-    current_balance = c.execute("SELECT balance FROM users WHERE user_id = ?", (user_id,)).fetchone()[0]
+    current_balance = get_account_snapshot(c, user_id)["balance"]
 
     st.markdown("<h1 style='font-family: Inter;'>Main Account (Vault)</h1>", unsafe_allow_html=True)
     co1, co2 = st.columns(2)
@@ -2284,7 +3412,8 @@ def savings_view(conn, user_id):
     
     st.markdown("<h1 style='font-family: Inter;'>Savings Account</h1>", unsafe_allow_html=True)
 
-    has_savings_account = c.execute("SELECT has_savings_account FROM users WHERE user_id = ?", (user_id,)).fetchone()[0]
+    account = get_account_snapshot(c, user_id)
+    has_savings_account = account["has_savings_account"]
 
     if not has_savings_account:
         if st.button("Set Up a Savings Account (%0.005 Interest Per Hour) - Boostable", type="primary", use_container_width=True):
@@ -2299,7 +3428,7 @@ def savings_view(conn, user_id):
     else:
         col1, col2 = st.columns(2)
         with col1:
-            savings_balance = c.execute("SELECT balance FROM savings WHERE user_id = ?", (user_id,)).fetchone()[0]
+            savings_balance = account["savings"]
             with st.container(border=True):
                 st.caption("Total Savings")
                 st.write(f"# <span style='font-family: Inter;'>${format_number_with_dots(round(savings_balance, 2))}</span>", unsafe_allow_html=True)
@@ -2314,7 +3443,7 @@ def savings_view(conn, user_id):
                     apply_interest_if_due(conn, user_id)
 
             if has_savings_account:
-                interest = c.execute("SELECT interest_rate from savings WHERE user_id = ?", (user_id,)).fetchone()[0]
+                interest = account["interest_rate"]
                 with st.container(border=True):
                     st.caption(":gray[Daily Simple Interest]")
                     c1, c2, c3 = st.columns([2.5, 2.5, 2.5])
@@ -2395,42 +3524,12 @@ def dashboard(conn, user_id):
     apply_daily_maintenance_cost(conn, user_id)
     apply_loan_penalty(conn, user_id)
     distribute_dividends(conn)
-    streak = c.execute("SELECT login_streak FROM users WHERE user_id = ?", (user_id,)).fetchone()[0]
-    credit_score = c.execute("SELECT credit_score FROM users WHERE user_id = ?", (user_id,)).fetchone()[0]
-    balance = c.execute("SELECT balance FROM users WHERE user_id = ?", (user_id,)).fetchone()[0]
-    vip_tier = c.execute("SELECT vip_tier FROM users WHERE user_id = ?", (user_id,)).fetchone()[0]
-    has_savings = c.execute("SELECT has_savings_account FROM users WHERE user_id = ?", (user_id,)).fetchone()[0]
-    if has_savings:
-        savings = c.execute("SELECT balance FROM savings WHERE user_id = ?", (user_id,)).fetchone()[0]
-    else:
-        savings = 0
-
-    real_estates_worth = c.execute("SELECT SUM(price) FROM real_estate WHERE user_id = ?", (user_id,)).fetchone()[0]
-    if not real_estates_worth:
-        real_estates_worth = 0
-        
-    user_shares = c.execute("""
-        SELECT ucs.shares_owned, cl.total_worth
-        FROM user_country_shares ucs
-        JOIN country_lands cl ON ucs.country_id = cl.country_id
-        WHERE ucs.user_id = ?
-    """, (user_id,)).fetchall()
-    
-    total_country_worth = sum((shares / 100) * total for shares, total in user_shares)
-
-    user_stocks = c.execute("""
-        SELECT us.quantity, s.price
-        FROM user_stocks us
-        JOIN stocks s ON us.stock_id = s.stock_id
-        WHERE us.user_id = ?
-    """, (user_id,)).fetchall()
-    
-    total_stock_worth = sum(quantity * price for quantity, price in user_stocks)
-    loan = c.execute("SELECT loan FROM users WHERE user_id = ?", (user_id,)).fetchone()[0]
-    if not loan:
-        loan = 0.0
-
-    total_worth = balance + savings + real_estates_worth + total_country_worth + total_stock_worth - loan
+    account = get_account_snapshot(c, user_id)
+    streak = account["login_streak"]
+    credit_score = account["credit_score"]
+    balance = account["balance"]
+    savings = account["savings"]
+    total_worth, loan = account["net_worth"], account["loan"]
     
     transactions = c.execute("""
         SELECT timestamp, type, amount 
@@ -2467,9 +3566,6 @@ def dashboard(conn, user_id):
         claim_daily_reward(conn, user_id)
         st.rerun()
     
-    if has_savings:
-        savings_balance = c.execute("SELECT balance FROM savings WHERE user_id = ?", (user_id,)).fetchone()[0]
-
     st.text("")
     st.text("")
     st.text("")
@@ -2532,6 +3628,15 @@ def dashboard(conn, user_id):
             st.write(create_padded_row("Credit Score", f"{credit_score}", ""), unsafe_allow_html=True)
             st.write(create_padded_row("Login Streak", f"{streak}", ""), unsafe_allow_html=True)
 
+        worth_rank = get_user_rank(c, user_id, "worth")
+        if worth_rank:
+            with st.container(border=True):
+                st.write(create_padded_row("Net Worth Rank", f"#{worth_rank['rank']}", "orange"), unsafe_allow_html=True)
+                if worth_rank["above"]:
+                    st.caption(f"▲ {worth_rank['above'][0]} is :green[${format_number(worth_rank['above'][1] - worth_rank['score'])}] ahead")
+                if worth_rank["below"]:
+                    st.caption(f"▼ {worth_rank['below'][0]} is :red[${format_number(worth_rank['score'] - worth_rank['below'][1])}] behind")
+
     with c2:
         with st.container(border=True, height=340):
             st.caption(":gray[Recent Transactions]")
@@ -2573,12 +3678,28 @@ def dashboard(conn, user_id):
                 else:
                     st.info("No recent transactions.")
 
+    net_worth_history = get_net_worth_history(c, user_id)
+    if len(net_worth_history) > 1:
+        with st.container(border=True):
+            first_worth = net_worth_history[0][1]
+            change = total_worth - first_worth
+            st.caption(f":gray[Net Worth Since {net_worth_history[0][0]}]  {':green' if change >= 0 else ':red'}[{'+' if change >= 0 else '-'}${format_number(abs(change))}]")
+            renderLightweightCharts([
+                {
+                    "chart": {
+                        "height": 250,
+                        "layout": {"textColor": 'rgba(180, 180, 180, 1)', "background": {"type": 'solid', "color": 'rgb(15, 17, 22)'}},
+                        "grid": {"vertLines": {"color": "rgba(30, 30, 30, 0.7)"}, "horzLines": {"color": "rgba(30, 30, 30, 0.7)"}},
+                    },
+                    "series": prepare_chart_data([{"time": day, "value": round(worth, 2)} for day, worth in net_worth_history]),
+                }
+            ], 'net_worth_history')
+
     st.text("")
     st.text("")
-    vip_tier = c.execute("SELECT vip_tier FROM users WHERE user_id = ?", (user_id,)).fetchone()
+    vip_tier = account["vip_tier"]
     if vip_tier is not None or vip_tier != "" or vip_tier != "None" or vip_tier != "NULL":
-        vip_tier = vip_tier[0]
-        card_url = c.execute("SELECT card_url FROM users WHERE user_id = ?", (user_id,)).fetchone()[0]
+        card_url = account["card_url"]
         with st.container(border=True):
             co1, co2 = st.columns(2)
             with co1:
@@ -2594,132 +3715,199 @@ def dashboard(conn, user_id):
     else:
         st.info("You do not own a Genova Card")
 
-def get_latest_message_time(conn):
-    c = conn.cursor()
-    c.execute("SELECT MAX(timestamp) FROM chats")
-    return c.fetchone()[0] or "1970-01-01 00:00:00"
+CHAT_BUFFER_SIZE = 50
+CHAT_PAGE_SIZE = 50
+
+def fetch_chat_messages(c, channel_id, after_id):
+    # (channel_id, id) is indexed, so "newer than the cursor" is a range probe on one channel.
+    if after_id is None:
+        rows = c.execute("""
+            SELECT m.id, u.username, m.message, m.timestamp
+            FROM chat_messages m
+            JOIN users u ON m.user_id = u.user_id
+            WHERE m.channel_id = ?
+            ORDER BY m.id DESC
+            LIMIT ?
+        """, (channel_id, CHAT_BUFFER_SIZE)).fetchall()
+        return rows[::-1]
+
+    return c.execute("""
+        SELECT m.id, u.username, m.message, m.timestamp
+        FROM chat_messages m
+        JOIN users u ON m.user_id = u.user_id
+        WHERE m.channel_id = ? AND m.id > ?
+        ORDER BY m.id
+        LIMIT ?
+    """, (channel_id, after_id, CHAT_BUFFER_SIZE)).fetchall()
+
+def load_chat_history(c, channel_id, before_id, limit=CHAT_PAGE_SIZE):
+    # Keyset page of messages older than before_id: hot rows first, then archived chunks, newest first.
+    page = c.execute("""
+        SELECT m.id, u.username, m.message, m.timestamp
+        FROM chat_messages m
+        JOIN users u ON m.user_id = u.user_id
+        WHERE m.channel_id = ? AND m.id < ?
+        ORDER BY m.id DESC
+        LIMIT ?
+    """, (channel_id, before_id, limit)).fetchall()
+
+    cursor = page[-1][0] if page else before_id
+    while len(page) < limit:
+        chunk = c.execute("""
+            SELECT first_id, payload FROM chat_archive
+            WHERE channel_id = ? AND first_id < ?
+            ORDER BY first_id DESC
+            LIMIT 1
+        """, (channel_id, cursor)).fetchone()
+        if chunk is None:
+            break
+        archived = [(message_id, username, message, timestamp) for message_id, _, username, message, timestamp in json.loads(zlib.decompress(chunk[1]))]
+        page.extend([row for row in reversed(archived) if row[0] < cursor][:limit - len(page)])
+        cursor = chunk[0]
+
+    return page[::-1]
+
+def archive_chat_messages(c, today):
+    for channel_id, retention_days in c.execute("SELECT channel_id, retention_days FROM chat_channels").fetchall():
+        # Cutting at a day boundary means each channel archives at most once a day, one chunk per day.
+        cutoff = (today - datetime.timedelta(days=retention_days)).isoformat()
+        oldest = c.execute("SELECT timestamp FROM chat_messages WHERE channel_id = ? ORDER BY id LIMIT 1", (channel_id,)).fetchone()
+        if not oldest or oldest[0] >= cutoff:
+            continue
 
-def chat_view(conn):
-    if "last_chat_time" not in st.session_state:
-        st.session_state.last_chat_time = "1970-01-01 00:00:00"
+        expired = c.execute("""
+            SELECT m.id, m.user_id, COALESCE(u.username, ''), m.message, m.timestamp
+            FROM chat_messages m
+            LEFT JOIN users u ON m.user_id = u.user_id
+            WHERE m.channel_id = ? AND m.timestamp < ?
+            ORDER BY m.id
+        """, (channel_id, cutoff)).fetchall()
+        for day, messages in itertools.groupby(expired, key=lambda row: row[4][:10]):
+            messages = list(messages)
+            c.execute("""
+                INSERT OR REPLACE INTO chat_archive (channel_id, first_id, last_id, day, message_count, payload)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (channel_id, messages[0][0], messages[-1][0], day, len(messages), zlib.compress(json.dumps(messages).encode())))
+        c.execute("DELETE FROM chat_messages WHERE channel_id = ? AND id <= ? AND timestamp < ?", (channel_id, expired[-1][0], cutoff))
+
+CHAT_SYNC_SECONDS = 5
+
+@st.cache_resource
+def get_chat_broadcaster():
+    # One ring buffer per channel for the whole process; sessions read it instead of each querying SQLite.
+    return {"lock": threading.Lock(), "channels": {}}
+
+def sync_chat_channel(c, channel_id, force=False):
+    broadcaster = get_chat_broadcaster()
+    with broadcaster["lock"]:
+        channel = broadcaster["channels"].get(channel_id)
+        if channel is None:
+            channel = {"messages": collections.deque(maxlen=CHAT_BUFFER_SIZE), "snapshot": [], "last_id": None, "synced_at": 0}
+            broadcaster["channels"][channel_id] = channel
+
+        # Local sends force a sync; otherwise one probe per CHAT_SYNC_SECONDS picks up other processes' messages.
+        if force or time.time() - channel["synced_at"] >= CHAT_SYNC_SECONDS:
+            new_messages = fetch_chat_messages(c, channel_id, channel["last_id"])
+            if new_messages:
+                channel["messages"].extend(new_messages)
+                channel["snapshot"] = list(channel["messages"])
+                channel["last_id"] = new_messages[-1][0]
+            channel["synced_at"] = time.time()
+
+        # The snapshot list is replaced, never mutated, so readers can hold it without the lock.
+        return channel["snapshot"]
+
+def publish_chat_message(conn, channel_id, user_id, message):
+    conn.execute("INSERT INTO chat_messages (channel_id, user_id, message, timestamp) VALUES (?, ?, ?, CURRENT_TIMESTAMP)", (channel_id, user_id, message))
+    conn.commit()
+    sync_chat_channel(conn.cursor(), channel_id, force=True)
 
+def chat_view(conn):
     if "cd" not in st.session_state:
         st.session_state.cd = datetime.datetime.now()
 
-    st_autorefresh(interval=5000, key="chat_autorefresh")
-
     c = conn.cursor()
-    messages1 = c.execute("""
-        SELECT u.username, c.message, c.timestamp 
-        FROM chats c 
-        JOIN users u ON c.user_id = u.user_id 
-        ORDER BY c.timestamp DESC 
-        LIMIT 20
-    """).fetchall()
-
-    messages2 = c.execute("""
-        SELECT u.username, c.message, c.timestamp 
-        FROM chats2 c 
-        JOIN users u ON c.user_id = u.user_id 
-        ORDER BY c.timestamp DESC 
-        LIMIT 20
-    """).fetchall()
-
-    messages1.reverse()
-    messages2.reverse()
-
-    t1, t2 = st.tabs(["🌐 #ENGLISH", "💬 #OTHER"])
-    st.markdown('''<style>
-                        button[data-baseweb="tab"] {
-                        font-size: 24px;
-                        margin: 0;
-                        width: 100%;
-                        }
-                        </style>
-                ''', unsafe_allow_html=True)
-    
-    with t1:
-        with st.container(height=400, border=False):  
-            chat_container = st.container()
-            with chat_container:
-                for username, message, timestamp in messages1:
-                    if username == "egegvner":
-                        with st.chat_message(name="ai"):
-                            st.write(f":orange[[{username}] **:red[[DEV]]** :gray[{timestamp.split()[1][:5]}]] **{message}**")
-                    elif username == "JohnyJohnyJohn":
-                        with st.chat_message(name="ai"):
-                            st.write(f":green[[{username}] **:green[[MOD]]** :gray[{timestamp.split()[1][:5]}]] **{message}**")
-                    else:
-                        with st.chat_message(name="user"):
-                            st.write(f":gray[[{username}] :gray[[{timestamp.split()[1][:5]}]]] {message}")
-
-        new_message = st.chat_input(placeholder="Message @English", key="chat_input")
-
-        if new_message:
-            send_disabled = (datetime.datetime.now() - st.session_state.cd).total_seconds() < 2
-            if not send_disabled:
-                if new_message.strip():
-                    c.execute(
-                            "INSERT INTO chats (user_id, message, timestamp) VALUES (?, ?, CURRENT_TIMESTAMP)", 
-                            (st.session_state.user_id, new_message.strip())
-                        )
-                    conn.commit()
-                        
-                    st.session_state.last_chat_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    st.session_state.cd = datetime.datetime.now()
-                    st.rerun()
-                else:
-                    st.toast("Message cannot be empty!")
+    channels = get_reference(c, "chat_channels")["rows"]
+    if not channels:
+        st.info("No chat channels yet.")
+        return
 
+    def render_messages(messages):
+        for _, username, message, timestamp in messages:
+            sent_at = timestamp.split()[1][:5]
+            if username == "egegvner":
+                with st.chat_message(name="ai"):
+                    st.write(f":orange[[{username}] **:red[[DEV]]** :gray[{sent_at}]] **{message}**")
+            elif username == "JohnyJohnyJohn":
+                with st.chat_message(name="ai"):
+                    st.write(f":green[[{username}] **:green[[MOD]]** :gray[{sent_at}]] **{message}**")
             else:
-                st.toast("Please wait a bit before sending another message.")
+                with st.chat_message(name="user"):
+                    st.write(f":gray[[{username}] :gray[[{sent_at}]]] {message}")
 
-    with t2:
+    # Only the message log polls; the input and the rest of the page stay put between refreshes.
+    @st.fragment(run_every=CHAT_REFRESH_SECONDS)
+    def chat_log(channel_id):
         with st.container(height=400, border=False):  
-            chat_container = st.container()
-            with chat_container:
-                for username, message, timestamp in messages2:
-                    if username == "egegvner":
-                        with st.chat_message(name="ai"):
-                            st.write(f":orange[[{username}] **:red[[DEV]]** :gray[{timestamp.split()[1]}]] **{message}**")
-                    elif username == "JohnyJohnyJohn":
-                        with st.chat_message(name="ai"):
-                            st.write(f":green[[{username}] **:green[[MOD]]** :gray[{timestamp.split()[1]}]] **{message}**")
-                    else:
-                        with st.chat_message(name="user"):
-                            st.write(f":gray[[{username}] :gray[[{timestamp.split()[1]}]]] {message}")
+            render_messages(sync_chat_channel(c, channel_id))
+
+    tab = lazy_tabs([label for _, _, label, _ in channels], key="chat_tab")
+
+    channel_id, _, label, _ = channels[tab]
+    # Scroll-back pages are kept per session and only grow when asked for. "until" is the live window's
+    # oldest id when the first page was loaded; the pages hold every message below it.
+    history = st.session_state.setdefault("chat_history", {}).setdefault(channel_id, {"messages": [], "until": None})
+    live = sync_chat_channel(c, channel_id)
+    if history["until"] is not None and live and live[0][0] > history["until"]:
+        # The ring buffer has slid past the loaded pages; start over rather than show a silent gap.
+        history.update(messages=[], until=None)
+
+    with st.expander("Earlier messages"):
+        render_messages(history["messages"])
+        if st.button("Load older messages", key=f"chat_older_{channel_id}", use_container_width=True):
+            if history["messages"]:
+                oldest_id = history["messages"][0][0]
+            else:
+                oldest_id = history["until"] = live[0][0] if live else None
+            page = load_chat_history(c, channel_id, oldest_id) if oldest_id is not None else []
+            if page:
+                history["messages"][:0] = page
+                st.rerun()
+            else:
+                st.toast("No older messages.")
 
-        new_message = st.chat_input(placeholder="Message @English", key="chat2_input")
+    chat_log(channel_id)
 
-        if new_message:
-            send_disabled = (datetime.datetime.now() - st.session_state.cd).total_seconds() < 2
-            if not send_disabled:
-                if new_message.strip():
-                    c.execute(
-                            "INSERT INTO chats2 (user_id, message, timestamp) VALUES (?, ?, CURRENT_TIMESTAMP)", 
-                            (st.session_state.user_id, new_message.strip())
-                        )
-                    conn.commit()
-                        
-                    st.session_state.last_chat_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    st.session_state.cd = datetime.datetime.now()
-                    st.rerun()
-                else:
-                    st.toast("Message cannot be empty!")
+    new_message = st.chat_input(placeholder=f"Message {label}", key=f"chat_input_{channel_id}")
 
+    if new_message:
+        send_disabled = (datetime.datetime.now() - st.session_state.cd).total_seconds() < 2
+        if not send_disabled:
+            if new_message.strip():
+                publish_chat_message(conn, channel_id, st.session_state.user_id, new_message.strip())
+                    
+                st.session_state.cd = datetime.datetime.now()
+                st.rerun()
             else:
-                st.toast("Please wait a bit before sending another message.")
+                st.toast("Message cannot be empty!")
 
-def get_latest_message_time(conn):
-    c = conn.cursor()
-    c.execute("SELECT MAX(timestamp) FROM chats")
-    return c.fetchone()[0] or "1970-01-01 00:00:00"
+        else:
+            st.toast("Please wait a bit before sending another message.")
 
 def transaction_history_view(conn, user_id):
     c = conn.cursor()
 
     st.markdown("<h1 style='font-family: Inter;'>📜 Transaction History</h1>", unsafe_allow_html=True)
-    get_transaction_history(conn, user_id)
+    search = st.text_input("Search", label_visibility="collapsed", placeholder="Search by type or receiver", key="history_search")
+    if search.strip():
+        matches = search_transactions(get_read_connection().cursor(), search, user_id)
+        if matches:
+            df = pd.DataFrame([row[:1] + row[2:] for row in matches], columns=["Transaction ID", "Type", "Amount ($)", "Receiver", "Status", "Timestamp"])
+            st.dataframe(df, use_container_width=True, hide_index=True)
+        else:
+            st.info("No matching transactions.")
+    else:
+        get_transaction_history(conn, user_id)
     st.subheader("Investments", divider="rainbow")
     investments = c.execute("""
         SELECT investment_id, company_name, amount, risk_level, return_rate, start_date, end_date, status 
@@ -2736,37 +3924,39 @@ def transaction_history_view(conn, user_id):
     st.divider()
 
 def buy_blackmarket_item(conn, buyer_id, item_id, item_number, seller_id, price):
-    c = conn.cursor()
-    c.execute("UPDATE users SET balance = balance - ? WHERE user_id = ?", (price, buyer_id))
-    
     tax = (price / 100) * 0.5
     net = price - tax
-    c.execute("UPDATE users SET balance = balance + ? WHERE user_id = ?", (net, seller_id))
-    c.execute("UPDATE users SET balance = balance + ? WHERE username = 'Government'", (tax,))
 
-    item = c.execute("SELECT boost_type, boost_value FROM marketplace_items WHERE item_id = ?", (item_id,)).fetchone()
-    boost_type, boost_value = item
+    def purchase_listing(c):
+        apply_postings(c, [
+            debit_user(buyer_id, price),
+            credit_user(seller_id, net),
+            credit_treasury(tax),
+        ])
 
-    if boost_type == "interest_boost":
-        c.execute("UPDATE savings SET interest_rate = interest_rate + ? WHERE user_id = ?", (boost_value, buyer_id))
-        conn.commit()
-    if boost_type == "attack_boost":
-        c.execute("UPDATE users SET attack_level = attack_level + ? WHERE user_id = ?", (boost_value, buyer_id))
-        conn.commit()
-    if boost_type == "defense_boost":
-        c.execute("UPDATE users SET defense_level = defense_level + ? WHERE user_id = ?", (boost_value, buyer_id))
-        conn.commit()
-                     
-    c.execute("INSERT INTO user_inventory (user_id, item_id, item_number, acquired_at) VALUES (?, ?, ?, ?)", 
-              (buyer_id, item_id, item_number, datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+        item = c.execute("SELECT boost_type, boost_value FROM marketplace_items WHERE item_id = ?", (item_id,)).fetchone()
+        boost_type, boost_value = item
 
-    c.execute("DELETE FROM blackmarket_items WHERE item_id = ?", (item_id,))
-    
-    conn.commit()
+        if boost_type == "interest_boost":
+            c.execute("UPDATE savings SET interest_rate = interest_rate + ? WHERE user_id = ?", (boost_value, buyer_id))
+        if boost_type == "attack_boost":
+            c.execute("UPDATE users SET attack_level = attack_level + ? WHERE user_id = ?", (boost_value, buyer_id))
+        if boost_type == "defense_boost":
+            c.execute("UPDATE users SET defense_level = defense_level + ? WHERE user_id = ?", (boost_value, buyer_id))
+                         
+        c.execute("INSERT INTO user_inventory (user_id, item_id, item_number, acquired_at) VALUES (?, ?, ?, ?)", 
+                  (buyer_id, item_id, item_number, datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
 
-def adjust_stock_prices(conn, stock_id, quantity, action):
-    c = conn.cursor()
-    
+        c.execute("DELETE FROM blackmarket_items WHERE item_id = ?", (item_id,))
+
+    try:
+        run_write(purchase_listing)
+        return True
+    except ValueError as e:
+        st.error(str(e))
+        return False
+
+def adjust_stock_prices(c, stock_id, quantity, action):
     price, stock_amount = c.execute("SELECT price, stock_amount FROM stocks WHERE stock_id = ?", (stock_id,)).fetchone()
     
     elasticity_factor = 1
@@ -2778,86 +3968,94 @@ def adjust_stock_prices(conn, stock_id, quantity, action):
     
     new_price = price + price_change
     c.execute("UPDATE stocks SET price = ? WHERE stock_id = ?", (new_price, stock_id))
-    
-    conn.commit()
-    st.rerun()
 
 def buy_stock(conn, user_id, stock_id, quantity):
-    c = conn.cursor()
+    transaction_id = next_id("transactions")
 
-    price, symbol = c.execute("SELECT price, symbol FROM stocks WHERE stock_id = ?", (stock_id,)).fetchone()
-    balance = c.execute("SELECT balance FROM users WHERE user_id = ?", (user_id,)).fetchone()[0]
-    cost = price * quantity
+    def purchase_stock(c):
+        price, symbol = c.execute("SELECT price, symbol FROM stocks WHERE stock_id = ?", (stock_id,)).fetchone()
+        cost = price * quantity
 
-    if balance < cost:
-        st.toast("Insufficient funds.")
-        return
-    
-    c.execute("UPDATE users SET balance = balance + ? WHERE username = 'Government'", (cost,))
-    c.execute("UPDATE users SET balance = balance - ? WHERE user_id = ?", (cost, user_id))
+        apply_postings(c, [
+            debit_user(user_id, cost),
+            credit_treasury(cost),
+            record_transaction(user_id, f"Buy Stock ({symbol})", cost, stock_id=stock_id, quantity=quantity, transaction_id=transaction_id),
+        ])
 
-    existing = c.execute("SELECT quantity, avg_buy_price FROM user_stocks WHERE user_id = ? AND stock_id = ?", 
-                         (user_id, stock_id)).fetchone()
+        existing = c.execute("SELECT quantity, avg_buy_price FROM user_stocks WHERE user_id = ? AND stock_id = ?", 
+                             (user_id, stock_id)).fetchone()
 
-    if existing:
-        old_quantity = existing[0]
-        old_avg_price = existing[1]
+        if existing:
+            old_quantity = existing[0]
+            old_avg_price = existing[1]
 
-        new_quantity = old_quantity + quantity
-        new_avg_price = ((old_quantity * old_avg_price) + (quantity * price)) / new_quantity
+            new_quantity = old_quantity + quantity
+            new_avg_price = ((old_quantity * old_avg_price) + (quantity * price)) / new_quantity
 
-        c.execute("UPDATE user_stocks SET quantity = ?, avg_buy_price = ? WHERE user_id = ? AND stock_id = ?", 
-                  (new_quantity, new_avg_price, user_id, stock_id))
-    else:
-        c.execute("INSERT INTO user_stocks (user_id, stock_id, quantity, avg_buy_price) VALUES (?, ?, ?, ?)", 
-                  (user_id, stock_id, quantity, price))
+            c.execute("UPDATE user_stocks SET quantity = ?, avg_buy_price = ? WHERE user_id = ? AND stock_id = ?", 
+                      (new_quantity, new_avg_price, user_id, stock_id))
+        else:
+            c.execute("INSERT INTO user_stocks (user_id, stock_id, quantity, avg_buy_price) VALUES (?, ?, ?, ?)", 
+                      (user_id, stock_id, quantity, price))
 
-    c.execute("INSERT INTO transactions (transaction_id, user_id, type, amount, stock_id, quantity, timestamp) VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)", (random.randint(100000000000, 999999999999), user_id, f"Buy Stock ({symbol})", cost, stock_id, quantity))
-    c.execute("UPDATE stocks SET stock_amount = stock_amount - ? WHERE stock_id = ?", (quantity, stock_id))
-    adjust_stock_prices(conn, stock_id, quantity, "buy")
+        c.execute("UPDATE stocks SET stock_amount = stock_amount - ? WHERE stock_id = ?", (quantity, stock_id))
+        adjust_stock_prices(c, stock_id, quantity, "buy")
+        return cost
+
+    try:
+        cost = run_write(purchase_stock)
+    except ValueError as e:
+        st.toast(str(e))
+        return
 
-    conn.commit()
     st.toast(f"Purchased :blue[{format_number(quantity)}] shares for :green[${format_number(cost, 2)}]")
 
 def sell_stock(conn, user_id, stock_id, quantity):
+    transaction_id = next_id("transactions")
 
-    c = conn.cursor()
+    def liquidate_stock(c):
+        price, symbol = c.execute("SELECT price, symbol FROM stocks WHERE stock_id = ?", (stock_id,)).fetchone()
+        user_stock = c.execute("SELECT quantity, avg_buy_price FROM user_stocks WHERE user_id = ? AND stock_id = ?", 
+                               (user_id, stock_id)).fetchone()
 
-    price, symbol = c.execute("SELECT price, symbol FROM stocks WHERE stock_id = ?", (stock_id,)).fetchone()
-    user_stock = c.execute("SELECT quantity, avg_buy_price FROM user_stocks WHERE user_id = ? AND stock_id = ?", 
-                           (user_id, stock_id)).fetchone()
+        if not user_stock or user_stock[0] < quantity:
+            raise ValueError("You do not hold that many shares.")
 
-    new_quantity = user_stock[0] - quantity
-    profit = price * quantity
-    tax = (profit / 100) * 0.05
-    net_profit = profit - tax
+        new_quantity = user_stock[0] - quantity
+        profit = price * quantity
+        tax = (profit / 100) * 0.05
+        net_profit = profit - tax
 
-    if new_quantity == 0:
-        c.execute("DELETE FROM user_stocks WHERE user_id = ? AND stock_id = ?", (user_id, stock_id))
-        c.execute("UPDATE stocks SET stock_amount = stock_amount + ? WHERE stock_id = ?", (quantity, stock_id))
+        if new_quantity == 0:
+            c.execute("DELETE FROM user_stocks WHERE user_id = ? AND stock_id = ?", (user_id, stock_id))
+            c.execute("UPDATE stocks SET stock_amount = stock_amount + ? WHERE stock_id = ?", (quantity, stock_id))
 
-    else:
-        c.execute("UPDATE user_stocks SET quantity = ? WHERE user_id = ? AND stock_id = ?", 
-                  (new_quantity, user_id, stock_id))
-        c.execute("UPDATE stocks SET stock_amount = stock_amount + ? WHERE stock_id = ?", (quantity, stock_id))
+        else:
+            c.execute("UPDATE user_stocks SET quantity = ? WHERE user_id = ? AND stock_id = ?", 
+                      (new_quantity, user_id, stock_id))
+            c.execute("UPDATE stocks SET stock_amount = stock_amount + ? WHERE stock_id = ?", (quantity, stock_id))
+
+        apply_postings(c, [
+            debit_treasury(profit),
+            credit_user(user_id, net_profit),
+            record_transaction(user_id, f"Sell Stock ({symbol})", net_profit, stock_id=stock_id, quantity=quantity, transaction_id=transaction_id),
+        ])
+        adjust_stock_prices(c, stock_id, quantity, "sell")
+        return net_profit
 
-    c.execute("INSERT INTO transactions (transaction_id, user_id, type, amount, stock_id, quantity) VALUES (?, ?, ?, ?, ?, ?)", (random.randint(100000000000, 999999999999), user_id, f"Sell Stock ({symbol})", net_profit, stock_id, quantity))
-    c.execute("UPDATE users SET balance = balance - ? WHERE username = 'Government'", (profit,))
-    c.execute("UPDATE users SET balance = balance + ? WHERE user_id = ?", (net_profit, user_id))
-    adjust_stock_prices(conn, stock_id, quantity, "sell")
+    try:
+        net_profit = run_write(liquidate_stock)
+    except ValueError as e:
+        st.toast(str(e))
+        return
 
-    conn.commit()
     st.toast(f"Sold :blue[{format_number(quantity)}] shares for :green[${format_number(net_profit, 2)}]") 
 
 def stocks_view(conn, user_id):
     c = conn.cursor()
-    
-    # preload_stocks_from_json(conn, "./stocks.json")
-    update_stock_prices(conn)
-    st_autorefresh(interval=60000, key="stock_autorefresh")
 
-    stocks = c.execute("SELECT stock_id, name, symbol, price, stock_amount, dividend_rate FROM stocks").fetchall()
-    balance = c.execute("SELECT balance FROM users WHERE user_id = ?", (user_id,)).fetchone()[0]
+    stocks = get_reference(c, "stocks")["rows"]
+    balance = get_account_snapshot(c, user_id)["balance"]
 
     if "selected_game_stock" not in st.session_state:
         st.session_state.selected_game_stock = stocks[0][0]
@@ -2877,50 +4075,93 @@ def stocks_view(conn, user_id):
     if "selected_real_stock" not in st.session_state:
         st.session_state.selected_real_stock = "AAPL"
 
-    t1, t2 = st.tabs(["🕹️ VIRTUAL", "📈 REAL"])
+    tab = lazy_tabs(["🕹️ VIRTUAL", "📈 REAL"], key="stocks_tab")
     
-    with t1:
+    if tab == 0:
 
-        stock_ticker_html = """
-        <div style="white-space: nowrap; overflow: hidden; background-color:; color: white; padding: 10px; font-size: 20px;">
-            <marquee behavior="scroll" direction="left" scrollamount="5">
-        """
+        # Prices only move on a scheduler tick, so the live regions refresh on the same cadence without rerunning the page.
+        @st.fragment(run_every=MARKET_TICK_SECONDS)
+        def price_ticker():
+            stock_ticker_html = """
+            <div style="white-space: nowrap; overflow: hidden; background-color:; color: white; padding: 10px; font-size: 20px;">
+                <marquee behavior="scroll" direction="left" scrollamount="5">
+            """
 
-        now = datetime.datetime.now()
-        start_time = now - datetime.timedelta(hours=24)
-        start_time_str = start_time.strftime("%Y-%m-%d %H:%M:%S")
+            market_stats = get_market_stats(c)
 
-        for stock_id, name, symbol, current_price, amt, dividend in stocks:
-            price_24h_ago = c.execute("""
-                SELECT price FROM stock_history 
-                WHERE stock_id = ? AND timestamp <= ? 
-                ORDER BY timestamp DESC LIMIT 1
-            """, (stock_id, start_time_str)).fetchone()
+            for stock_id, name, symbol, current_price, amt, dividend in get_reference(c, "stocks")["rows"]:
+                price_24h_ago = market_stats[stock_id]["open_24h"]
 
-            if price_24h_ago:
-                price_24h_ago = price_24h_ago[0]
-                price_color = "lime" if current_price >= price_24h_ago else "red"
-            else:
-                price_color = "white"
+                if price_24h_ago:
+                    price_color = "lime" if current_price >= price_24h_ago else "red"
+                else:
+                    price_color = "white"
+
+                stock_ticker_html += f" <span style='color: white;'>{symbol}</span> <span style='color: {price_color};'>${format_number(current_price, 2)}</span> <span style='color: darkgray'> | </span>"
+
+            stock_ticker_html += "</marquee></div>"
+
+            st.markdown(stock_ticker_html, unsafe_allow_html=True)
+
+        @st.fragment(run_every=MARKET_TICK_SECONDS)
+        def candle_chart(stock_id):
+            start_time = datetime.datetime.now() - datetime.timedelta(hours=st.session_state.hours)
+            candlestick_data = get_candles(c, stock_id, start_time, float(st.session_state.resample) * 3600)
+
+            if len(candlestick_data) > 1:
+                chartOptions = {
+                    "layout": {
+                        "textColor": 'rgba(180, 180, 180, 1)',
+                        "background": {
+                            "type": 'solid',
+                            "color": 'rgb(15, 17, 22)'
+                        }
+                    },
+                    "grid": {
+                        "vertLines": {"color": "rgba(30, 30, 30, 0.7)"},
+                        "horzLines": {"color": "rgba(30, 30, 30, 0.7)"}
+                    },
+                    "crosshair": {"mode": 0},
+                    "watermark": {
+                        "visible": True,
+                        "fontSize": 70,
+                        "horzAlign": 'center',
+                        "vertAlign": 'center',
+                        "color": 'rgba(50, 50, 50, 0.2)',
+                        "text": 'Genova',
+                    }
+                }
+
+                seriesCandlestickChart = [{
+                    "type": 'Candlestick',
+                    "data": candlestick_data,
+                    "options": {
+                        "upColor": '#26a69a',
+                        "downColor": '#ef5350',
+                        "borderVisible": False,
+                        "wickUpColor": '#26a69a',
+                        "wickDownColor": '#ef5350'
+                    }
+                }]
 
-            stock_ticker_html += f" <span style='color: white;'>{symbol}</span> <span style='color: {price_color};'>${format_number(current_price, 2)}</span> <span style='color: darkgray'> | </span>"
+                renderLightweightCharts([
+                    {"chart": chartOptions, "series": seriesCandlestickChart}
+                ], 'candlestick')
 
-        stock_ticker_html += "</marquee></div>"
+            else:
+                st.info("Stock history will be available after 60 seconds of stock creation.")
 
-        st.markdown(stock_ticker_html, unsafe_allow_html=True)
+        price_ticker()
+        market_stats = get_market_stats(c)
         
         selected_stock = next(s for s in stocks if s[0] == st.session_state.selected_game_stock)
         stock_id, name, symbol, price, stock_amount, dividend = selected_stock
 
-        now = datetime.datetime.now()
-        start_time = now - datetime.timedelta(hours=st.session_state.hours)
-        start_time_str = start_time.strftime("%Y-%m-%d %H:%M:%S")
-
         history = c.execute("""
-            SELECT timestamp, price FROM stock_history 
-            WHERE stock_id = ? AND timestamp >= ?
-            ORDER BY timestamp ASC
-        """, (stock_id, start_time_str)).fetchall()
+            SELECT bucket, close FROM stock_candles 
+            WHERE stock_id = ? AND resolution = 60
+            ORDER BY bucket DESC LIMIT 2
+        """, (stock_id,)).fetchall()[::-1]
 
         if len(history) > 1:
             last_price = history[-1][1]
@@ -2973,65 +4214,7 @@ def stocks_view(conn, user_id):
         c1, c2 = st.columns([2.1, 1.5])
 
         with c1:
-            if len(history) > 1:
-                df = pd.DataFrame(history, columns=["Timestamp", "Price"])
-                df["Timestamp"] = pd.to_datetime(df["Timestamp"])
-                df.set_index("Timestamp", inplace=True)
-
-                df_resampled = df.resample(f"{st.session_state.resample}h").ohlc()['Price'].dropna()
-
-                candlestick_data = [
-                    {
-                        "time": int(timestamp.timestamp()),
-                        "open": row["open"],
-                        "high": row["high"],
-                        "low": row["low"],
-                        "close": row["close"]
-                    }
-                    for timestamp, row in df_resampled.iterrows()
-                ]
-
-                chartOptions = {
-                    "layout": {
-                        "textColor": 'rgba(180, 180, 180, 1)',
-                        "background": {
-                            "type": 'solid',
-                            "color": 'rgb(15, 17, 22)'
-                        }
-                    },
-                    "grid": {
-                        "vertLines": {"color": "rgba(30, 30, 30, 0.7)"},
-                        "horzLines": {"color": "rgba(30, 30, 30, 0.7)"}
-                    },
-                    "crosshair": {"mode": 0},
-                    "watermark": {
-                        "visible": True,
-                        "fontSize": 70,
-                        "horzAlign": 'center',
-                        "vertAlign": 'center',
-                        "color": 'rgba(50, 50, 50, 0.2)',
-                        "text": 'Genova',
-                    }
-                }
-
-                seriesCandlestickChart = [{
-                    "type": 'Candlestick',
-                    "data": candlestick_data,
-                    "options": {
-                        "upColor": '#26a69a',
-                        "downColor": '#ef5350',
-                        "borderVisible": False,
-                        "wickUpColor": '#26a69a',
-                        "wickDownColor": '#ef5350'
-                    }
-                }]
-
-                renderLightweightCharts([
-                    {"chart": chartOptions, "series": seriesCandlestickChart}
-                ], 'candlestick')
-
-            else:
-                st.info("Stock history will be available after 60 seconds of stock creation.")
+            candle_chart(stock_id)
 
             q1, q2, q3, q4, q5, q6, q7, q8, q9 = st.columns(9)
 
@@ -3158,11 +4341,8 @@ def stocks_view(conn, user_id):
                     time.sleep(1)
                     st.rerun()
 
-        stock_metrics = get_stock_metrics(conn, stock_id)
-        stock_volume = c.execute("SELECT SUM(quantity) FROM transactions WHERE stock_id = ? AND timestamp >= DATETIME('now', '-24 hours')", (stock_id,)).fetchone()[0]
-        
-        if not stock_volume:
-            stock_volume = 0
+        stock_metrics = market_stats[stock_id]
+        stock_volume = stock_metrics["volume_24h"]
 
         st.text("")
         st.text("")
@@ -3188,7 +4368,7 @@ def stocks_view(conn, user_id):
         col6.write(f"#### :blue[{format_number(stock_volume)}]")
 
         col7.write("Volatility Index")
-        col7.write(f"#### :violet[{format_number(((stock_metrics['all_time_high'] - stock_metrics['all_time_low']) / stock_metrics['all_time_low']) * 100)} σ]")
+        col7.write(f"#### :violet[{format_number(((stock_metrics['all_time_high'] - stock_metrics['all_time_low']) / stock_metrics['all_time_low']) * 100)} σ]" if stock_metrics['all_time_low'] else "N/A")
 
         col8.write("Market Cap")
         col8.write(f"#### :green[${format_number(stock_amount * price)}]")
@@ -3221,7 +4401,7 @@ def stocks_view(conn, user_id):
         else:
             st.info("No stockholder data available yet.")
     
-    with t2:
+    if tab == 1:
 
         real_stocks = ["AAPL", "GOOGL", "MSFT", "AMZN", "META", "NVDA", "TSLA"]
 
@@ -3315,41 +4495,15 @@ def blackmarket_view(conn, user_id):
             if st.button(f"Buy for :green[${format_number(price)}]", key=f"buy_{item_id}", use_container_width=True, 
                          disabled=True if balance < price else False):
                 with st.spinner(f"Purchasing {name}..."):
-                    buy_blackmarket_item(conn, user_id, item_id, item_number, seller_id, price)
-                    time.sleep(2)
-                    st.success(f"🎉 Successfully purchased **{name}**!")
-                    st.rerun()
+                    if buy_blackmarket_item(conn, user_id, item_id, item_number, seller_id, price):
+                        time.sleep(2)
+                        st.success(f"🎉 Successfully purchased **{name}**!")
+                        st.rerun()
 
         st.divider()
 
 def calculate_total_worth(c, user_id):
-    balance = c.execute("SELECT balance FROM users WHERE user_id = ?", (user_id,)).fetchone()[0]
-    has_savings = c.execute("SELECT has_savings_account FROM users WHERE user_id = ?", (user_id,)).fetchone()[0]
-    savings = c.execute("SELECT balance FROM savings WHERE user_id = ?", (user_id,)).fetchone()[0] if has_savings else 0
-    real_estates_worth = c.execute("SELECT SUM(price) FROM real_estate WHERE user_id = ?", (user_id,)).fetchone()[0] or 0
-    
-    user_shares = c.execute("""
-        SELECT ucs.shares_owned, cl.total_worth
-        FROM user_country_shares ucs
-        JOIN country_lands cl ON ucs.country_id = cl.country_id
-        WHERE ucs.user_id = ?
-    """, (user_id,)).fetchall()
-    
-    total_country_worth = sum((shares / 100) * total for shares, total in user_shares)
-    
-    user_stocks = c.execute("""
-        SELECT us.quantity, s.price
-        FROM user_stocks us
-        JOIN stocks s ON us.stock_id = s.stock_id
-        WHERE us.user_id = ?
-    """, (user_id,)).fetchall()
-    
-    total_stock_worth = sum(quantity * price for quantity, price in user_stocks)
-    loan = c.execute("SELECT loan FROM users WHERE user_id = ?", (user_id,)).fetchone()[0] or 0.0
-
-    worth = balance + savings + real_estates_worth + total_country_worth + total_stock_worth - loan
-    
-    return worth if worth > 0 else 0
+    return c.execute("SELECT MAX(0, net_worth) FROM users WHERE user_id = ?", (user_id,)).fetchone()[0]
 
 def get_adjusted_interest_rate(credit_score, base_interest_rate, inflation_rate):
     inflation_factor = 1 + (inflation_rate / 10)
@@ -3414,16 +4568,18 @@ def borrow_money(conn, user_id, amount, base_interest_rate, duration):
     due_date = (today + datetime.timedelta(days=duration)).strftime("%Y-%m-%d")
     new_loan = round(amount * (1 + total_interest), 2)
 
-    c.execute("UPDATE users SET balance = balance - ? WHERE username = 'Government'", (amount,))
-    c.execute("UPDATE users SET balance = balance + ?, loan = ?, loan_due_date = ?, loan_start_date = ?, loan_duration = ? WHERE user_id = ?", 
-              (amount, new_loan, due_date, today.strftime("%Y-%m-%d"), duration, user_id))
-
-    c.execute("INSERT INTO transactions (transaction_id, user_id, type, amount) VALUES (?, ?, ?, ?)", 
-              (random.randint(100000000, 999999999), user_id, "Borrow Loan", amount))
+    legs = [
+        debit_treasury(amount),
+        credit_user(user_id, amount),
+        record_transaction(user_id, "Borrow Loan", amount),
+    ]
 
-    c.execute("UPDATE users SET credit_score = credit_score - 7 WHERE user_id = ?", (user_id,))
+    def open_loan(c):
+        apply_postings(c, legs)
+        c.execute("UPDATE users SET loan = ?, loan_due_date = ?, loan_start_date = ?, loan_duration = ?, credit_score = credit_score - 7 WHERE user_id = ?", 
+                  (new_loan, due_date, today.strftime("%Y-%m-%d"), duration, user_id))
 
-    conn.commit()
+    run_write(open_loan)
     st.toast(f"✅ Borrowed :green[${format_number_with_dots(amount)}] with daily interest of :red[{round(daily_interest_rate * 100, 2)}%]. Due Date: {due_date}.")
     time.sleep(2.5)
     st.rerun()
@@ -3461,16 +4617,22 @@ def repay_loan(conn, user_id, amount):
 
     new_loan = max(0, loan - amount)
 
-    c.execute("UPDATE users SET balance = balance + ? WHERE username = 'Government'", (amount,))
-    c.execute("UPDATE users SET balance = balance - ?, loan = ? WHERE user_id = ?", (amount, new_loan, user_id))
-    c.execute("INSERT INTO transactions (transaction_id, user_id, type, amount) VALUES (?, ?, ?, ?)", 
-              (random.randint(100000000, 999999999), user_id, "Repay Loan", amount))
+    legs = [
+        charge_user(user_id, amount),
+        credit_treasury(amount),
+        record_transaction(user_id, "Repay Loan", amount),
+    ]
+
+    def settle_loan(c):
+        apply_postings(c, legs)
+        c.execute("UPDATE users SET loan = ? WHERE user_id = ?", (new_loan, user_id))
+        if new_loan == 0:
+            c.execute("UPDATE users SET credit_score = credit_score + ? WHERE user_id = ?", (score, user_id))
 
+    run_write(settle_loan)
     if new_loan == 0:
-        c.execute("UPDATE users SET credit_score = credit_score + ? WHERE user_id = ?", (score, user_id))
         st.toast(f"✅ Loan fully repaid! Credit score improved.")
 
-    conn.commit()
     st.toast(f"✅ Loan repaid. Remaining debt: :red[${new_loan}].")
     time.sleep(2.5)
     st.rerun()
@@ -3542,18 +4704,9 @@ def bank_view(conn, user_id):
     inflation_rate = c.execute("SELECT inflation_rate FROM inflation_history ORDER BY date DESC LIMIT 1").fetchone()
     inflation_rate = inflation_rate[0] if inflation_rate else 0.01
 
-    t1, t2 = st.tabs(["Economy", "Loans & Repayments"])
-    st.markdown('''
-        <style>
-        button[data-baseweb="tab"] {
-            font-size: 24px;
-            margin: 0;
-            width: 100%;
-        }
-        </style>
-    ''', unsafe_allow_html=True)
+    tab = lazy_tabs(["Economy", "Loans & Repayments"], key="bank_tab")
 
-    with t1:
+    if tab == 0:
         st.header("Total Government Funds", divider="rainbow")
         c1, c2, c3 = st.columns([2, 1, 2])
         c2.subheader(f":green[${format_number(gov_funds)}]")
@@ -3597,7 +4750,7 @@ def bank_view(conn, user_id):
         else:
             st.info("No inflation data available yet.")
 
-    with t2:
+    if tab == 1:
         co1, co2 = st.columns(2)
         with co1:
             st.text("")
@@ -3676,7 +4829,7 @@ def investments_view(conn, user_id):
     c = conn.cursor()
 
     check_and_update_investments(conn, user_id)
-    balance = c.execute("SELECT balance FROM users WHERE user_id = ?", (user_id,)).fetchone()[0]
+    balance = get_account_snapshot(c, user_id)["balance"]
 
     if "s_c" not in st.session_state:
         st.session_state.s_c = None
@@ -3708,7 +4861,7 @@ def investments_view(conn, user_id):
 
     st.subheader(f"💰 Balance: **:green[${format_number(balance)}]**")
 
-    companies = c.execute("SELECT company_id, company_name, risk_level FROM investment_companies").fetchall()
+    companies = get_reference(c, "investment_companies")["rows"]
 
     if not companies:
         st.info("No investment opportunities are currently available.")
@@ -3766,11 +4919,7 @@ def investments_view(conn, user_id):
                 start_date = datetime.datetime.now()
                 end_date = start_date + datetime.timedelta(hours=duration_hours)
 
-                c.execute("UPDATE users SET balance = balance - ? WHERE user_id = ?", (investment_amount, user_id))
-                c.execute("""
-                    INSERT INTO investments (user_id, company_name, amount, risk_level, return_rate, start_date, end_date)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                """, (
+                investment = (
                     user_id,
                     st.session_state.s_c['name'],
                     investment_amount,
@@ -3778,9 +4927,25 @@ def investments_view(conn, user_id):
                     return_rate,
                     start_date.strftime("%Y-%m-%d %H:%M:%S"),
                     end_date.strftime("%Y-%m-%d %H:%M:%S"),
-                ))
-                c.execute("INSERT INTO transactions (transaction_id, user_id, type, amount) VALUES (?, ?, ?, ?)", (random.randint(100000000000, 999999999999), user_id, f"Investment Initiated to  {company_name}", investment_amount))
-                conn.commit()
+                )
+
+                legs = [
+                    debit_user(user_id, investment_amount),
+                    record_transaction(user_id, f"Investment Initiated to  {company_name}", investment_amount),
+                ]
+
+                def open_investment(c):
+                    apply_postings(c, legs)
+                    c.execute("""
+                        INSERT INTO investments (user_id, company_name, amount, risk_level, return_rate, start_date, end_date)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                    """, investment)
+
+                try:
+                    run_write(open_investment)
+                except ValueError as e:
+                    st.error(str(e))
+                    return
                 time.sleep(4)
             st.toast(f"Investment of :green[${format_number(investment_amount)}] in {selected_company['name']} has initiated! Ends on {end_date}.")
             time.sleep(2)
@@ -3821,38 +4986,16 @@ def investments_view(conn, user_id):
 def real_estate_marketplace_view(conn, user_id):
     c = conn.cursor()
     
-    load_lands_from_json(conn, "./lands.json")
-    
-    countries = c.execute("""
-            SELECT country_id, name, total_worth, share_price, latitude, longitude, border_geometry, image_url
-            FROM country_lands
-        """).fetchall()
+    tab = lazy_tabs(["🏠 PROPERTIES 🏠", "🚩 LANDS 🚩"], key="real_estate_tab")
     
-    top_shareholders = c.execute("""
-            SELECT country_id, username, shares_owned FROM user_country_shares 
-            JOIN users ON user_country_shares.user_id = users.user_id 
-            WHERE (country_id, shares_owned) IN (
-                SELECT country_id, MAX(shares_owned) 
-                FROM user_country_shares 
-                GROUP BY country_id
-            )
-        """).fetchall()
-    
-    load_real_estates_from_json(conn, "./real_estates.json")
+    if tab == 0:
+        properties = c.execute("""
+            SELECT property_id, region, type, price, rent_income, demand_factor, latitude, longitude, image_url, sold, username 
+            FROM real_estate
+            """).fetchall()
+        
+        username = c.execute("SELECT username FROM users WHERE user_id = ?", (user_id,)).fetchone()[0]
 
-    properties = c.execute("""
-        SELECT property_id, region, type, price, rent_income, demand_factor, latitude, longitude, image_url, sold, username 
-        FROM real_estate
-        """).fetchall()
-    
-    username = c.execute("SELECT username FROM users WHERE user_id = ?", (user_id,)).fetchone()[0]
-    user_shares = c.execute("""
-            SELECT country_id, shares_owned FROM user_country_shares WHERE user_id = ?
-        """, (user_id,)).fetchall()
-    
-    t1, t2 = st.tabs(["🏠 PROPERTIES 🏠", "🚩 LANDS 🚩"])
-    
-    with t1:
         if "selected_property" not in st.session_state:
             st.session_state.selected_property = None
 
@@ -3930,7 +5073,7 @@ def real_estate_marketplace_view(conn, user_id):
             else:
                 property_categories["LANDMARKS"].append(row)
 
-        tabs = st.tabs(["✈️ AIRPORTS ✈️", "⚓️ PORTS ⚓️", "🪅 LANDMARKS 🪅", "🏔️ MOUNTAINS 🏔️", "🏝️ ISLANDS 🏝️", "📚 BSB 📚"])
+        category_tab = lazy_tabs(["✈️ AIRPORTS ✈️", "⚓️ PORTS ⚓️", "🪅 LANDMARKS 🪅", "🏔️ MOUNTAINS 🏔️", "🏝️ ISLANDS 🏝️", "📚 BSB 📚"], key="real_estate_category_tab")
         tab_names = ["AIRPORTS", "PORTS", "LANDMARKS", "MOUNTAINS", "ISLANDS", "BSB"]
         
         property_categories = {category: [] for category in tab_names}
@@ -3950,56 +5093,71 @@ def real_estate_marketplace_view(conn, user_id):
             else:
                 property_categories["LANDMARKS"].append(row)
         
-        for tab, category in zip(tabs, tab_names):
-            with tab:
-                cw1, cw2 = st.columns([10, 1])
-                search_query = cw1.text_input(f"", label_visibility="collapsed", key=f"search_{category}", placeholder=f"Search {category.lower()}")
+        category = tab_names[category_tab]
+        cw1, cw2 = st.columns([10, 1])
+        search_query = cw1.text_input(f"", label_visibility="collapsed", key=f"search_{category}", placeholder=f"Search {category.lower()}")
         
-                search_button = cw2.button("", icon = ":material/search:", key=f"search_btn_{category}", use_container_width=True, type="primary")
+        search_button = cw2.button("", icon = ":material/search:", key=f"search_btn_{category}", use_container_width=True, type="primary")
         
-                properties_in_category = property_categories[category]
-                if search_button and search_query.strip():
-                    properties_in_category = [
-                        row for row in properties_in_category if search_query.lower() in row["Type"].lower()
-                    ]
+        properties_in_category = property_categories[category]
+        if search_button and search_query.strip():
+            properties_in_category = [
+                row for row in properties_in_category if search_query.lower() in row["Type"].lower()
+            ]
         
-                if not properties_in_category:
-                    st.info(f"No matching {category.lower()} found.")
-                else:
-                    for row in properties_in_category:
-                        image_col, details_col = st.columns([1, 3])
-                        with image_col:
-                            if row["Image URL"]:
-                                st.image(row["Image URL"], use_container_width=True)
+        if not properties_in_category:
+            st.info(f"No matching {category.lower()} found.")
+        else:
+            for row in properties_in_category:
+                image_col, details_col = st.columns([1, 3])
+                with image_col:
+                    if row["Image URL"]:
+                        st.image(row["Image URL"], use_container_width=True)
         
-                        with details_col:
-                            if row["Username"] == username:
-                                st.subheader(f"{row['Type']} :green[ - Owned]", divider="rainbow")
-                            elif row["Sold"]:
-                                st.subheader(f"{row['Type']} :red[ - Sold]", divider="rainbow")
-                            else:
-                                st.subheader(f"{row['Type']}", divider="rainbow")
+                with details_col:
+                    if row["Username"] == username:
+                        st.subheader(f"{row['Type']} :green[ - Owned]", divider="rainbow")
+                    elif row["Sold"]:
+                        st.subheader(f"{row['Type']} :red[ - Sold]", divider="rainbow")
+                    else:
+                        st.subheader(f"{row['Type']}", divider="rainbow")
         
-                            st.text("")
-                            c1, c2 = st.columns(2)
-                            c1.write(f":blue[COST] :red[${format_number(row['Price'])}]")
-                            c2.write(f":blue[RENT] :green[${format_number(row['Rent Income'])} / day]")
-                            c1.write(f":blue[Region] :grey[{row['Region']}]")
-                            c2.write(f":blue[Demand Factor] :green[{format_number(row['Demand Factor'])}]")
+                    st.text("")
+                    c1, c2 = st.columns(2)
+                    c1.write(f":blue[COST] :red[${format_number(row['Price'])}]")
+                    c2.write(f":blue[RENT] :green[${format_number(row['Rent Income'])} / day]")
+                    c1.write(f":blue[Region] :grey[{row['Region']}]")
+                    c2.write(f":blue[Demand Factor] :green[{format_number(row['Demand Factor'])}]")
         
-                            st.text("")
-                            if row["Username"] == username:
-                                st.success("You own this property.")
-                            elif row["Sold"] == 0:
-                                if st.button(f"Property Options", key=f"buy_{row['Property ID']}", use_container_width=True):
-                                    prop_details_dialog(conn, user_id, row["Property ID"])
-                            else:
-                                st.warning("This property has already been sold.")
+                    st.text("")
+                    if row["Username"] == username:
+                        st.success("You own this property.")
+                    elif row["Sold"] == 0:
+                        if st.button(f"Property Options", key=f"buy_{row['Property ID']}", use_container_width=True):
+                            prop_details_dialog(conn, user_id, row["Property ID"])
+                    else:
+                        st.warning("This property has already been sold.")
 
-                            st.caption(":gray[UPGRADABLE]")
-                        st.divider()
+                    st.caption(":gray[UPGRADABLE]")
+                st.divider()
+
+    if tab == 1:
+        countries = get_reference(c, "country_lands")["rows"]
+        
+        top_shareholders = c.execute("""
+                SELECT country_id, username, shares_owned FROM user_country_shares 
+                JOIN users ON user_country_shares.user_id = users.user_id 
+                WHERE (country_id, shares_owned) IN (
+                    SELECT country_id, MAX(shares_owned) 
+                    FROM user_country_shares 
+                    GROUP BY country_id
+                )
+            """).fetchall()
+        
+        user_shares = c.execute("""
+                SELECT country_id, shares_owned FROM user_country_shares WHERE user_id = ?
+            """, (user_id,)).fetchall()
 
-    with t2:
         def get_color_from_shares(share_percentage):
             normalized_value = np.clip(share_percentage / 100, 0, 1)
             red = int((1 - normalized_value) * 255)
@@ -4136,23 +5294,29 @@ def buy_country_shares(conn, user_id, country_id, shares_to_buy):
         st.error("❌ Insufficient funds!")
         return
 
-    c.execute("UPDATE users SET balance = balance - ? WHERE user_id = ?", (cost, user_id))
+    legs = [
+        debit_user(user_id, cost),
+        record_transaction(user_id, "Buy Country Shares", cost, quantity=shares_to_buy),
+    ]
 
-    existing_shares = c.execute("SELECT shares_owned FROM user_country_shares WHERE user_id = ? AND country_id = ?", 
-                                (user_id, country_id)).fetchone()
+    def purchase_shares(c):
+        apply_postings(c, legs)
 
-    if existing_shares:
-        new_shares = existing_shares[0] + shares_to_buy
-        c.execute("UPDATE user_country_shares SET shares_owned = ? WHERE user_id = ? AND country_id = ?", 
-                  (new_shares, user_id, country_id))
-        c.execute("INSERT INTO transactions (user_id, type, amount, quantity) VALUES (?, ?, ?)", (user_id, "Buy Country Shares", cost, shares_to_buy))
-    else:
-        c.execute("INSERT INTO user_country_shares (user_id, country_id, shares_owned) VALUES (?, ?, ?)", 
-                  (user_id, country_id, shares_to_buy))
-        c.execute("INSERT INTO transactions (user_id, type, amount, quantity) VALUES (?, ?, ?)", (user_id, "Buy Country Shares", cost, shares_to_buy))
+        existing_shares = c.execute("SELECT shares_owned FROM user_country_shares WHERE user_id = ? AND country_id = ?", 
+                                    (user_id, country_id)).fetchone()
 
+        if existing_shares:
+            new_shares = existing_shares[0] + shares_to_buy
+            c.execute("UPDATE user_country_shares SET shares_owned = ? WHERE user_id = ? AND country_id = ?", 
+                      (new_shares, user_id, country_id))
+        else:
+            c.execute("INSERT INTO user_country_shares (user_id, country_id, shares_owned) VALUES (?, ?, ?)", 
+                      (user_id, country_id, shares_to_buy))
 
-    conn.commit()
+    try:
+        run_write(purchase_shares)
+    except ValueError:
+        st.error("❌ Insufficient funds!")
 
 
 @st.dialog("Property Details", width="large")
@@ -4254,11 +5418,9 @@ def buy_property(conn, user_id, property_id):
     username = c.execute("SELECT username FROM users WHERE user_id = ?", (user_id,)).fetchone()[0]
     price = c.execute("SELECT price FROM real_estate WHERE property_id = ?", (property_id,)).fetchone()[0]
 
-    try:
-        c.execute("BEGIN TRANSACTION")
-        
-        c.execute("UPDATE users SET balance = balance - ? WHERE user_id = ?", (price, user_id))
-        
+    transaction_id = next_id("transactions")
+
+    def purchase_property(c):
         c.execute("""
             UPDATE real_estate 
             SET sold = 1, 
@@ -4282,29 +5444,25 @@ def buy_property(conn, user_id, property_id):
             (user_id, property_id, purchase_date, rent_income) 
             VALUES (?, ?, ?, ?)
         """, (user_id, property_id, purchase_date, rent_income))
-        
-        c.execute("""
-            INSERT INTO transactions 
-            (transaction_id, user_id, type, amount, timestamp) 
-            VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
-        """, (random.randint(100000000000, 999999999999), 
-              user_id, 
-              f"Property Purchase: {prop_type}", 
-              price))
-        
-        conn.commit()
+
+        apply_postings(c, [
+            debit_user(user_id, price),
+            record_transaction(user_id, f"Property Purchase: {prop_type}", price, transaction_id=transaction_id),
+        ])
+
+    try:
+        run_write(purchase_property)
         return True
         
     except Exception as e:
-        conn.rollback()
         st.error(f"Error purchasing property: {e}")
         return False
 
 def membership_view(conn, user_id):
     c = conn.cursor()
     balance, credit = c.execute("SELECT balance, credit_score FROM users WHERE user_id = ?", (user_id,)).fetchone()
-    t1, t2, t3, t4, t5, t6 = st.tabs(["GUEST", "MEMBER", "BRONZE", "SILVER", "GOLD", "OBSIDIAN"])
-    with t1:
+    tab = lazy_tabs(["GUEST", "MEMBER", "BRONZE", "SILVER", "GOLD", "OBSIDIAN"], key="membership_tab")
+    if tab == 0:
         st.text("")
         st.text("")
         st.text("")
@@ -4328,7 +5486,7 @@ def membership_view(conn, user_id):
                     buy_membership_dialog(conn, user_id, "Guest", 199000)
                 st.caption(":gray[USERNAME ON CARD AVAILABLE]")
 
-    with t2:
+    if tab == 1:
         st.text("")
         st.text("")
         st.text("")
@@ -4352,7 +5510,7 @@ def membership_view(conn, user_id):
                     buy_membership_dialog(conn, user_id, "Member", 629000)
                 st.caption(":gray[USERNAME ON CARD AVAILABLE]")
 
-    with t3:
+    if tab == 2:
         st.text("")
         st.text("")
         st.text("")
@@ -4376,7 +5534,7 @@ def membership_view(conn, user_id):
                     buy_membership_dialog(conn, user_id, "Bronze", 1500000)
                 st.caption(":gray[USERNAME ON CARD AVAILABLE]")
 
-    with t4:
+    if tab == 3:
         st.text("")
         st.text("")
         st.text("")
@@ -4400,7 +5558,7 @@ def membership_view(conn, user_id):
                     buy_membership_dialog(conn, user_id, "Silver", 8950000)
                 st.caption(":gray[USERNAME ON CARD AVAILABLE]")
 
-    with t5:
+    if tab == 4:
         st.text("")
         st.text("")
         st.text("")
@@ -4424,7 +5582,7 @@ def membership_view(conn, user_id):
                     buy_membership_dialog(conn, user_id, "Gold", 17400000)
                 st.caption(":gray[USERNAME ON CARD AVAILABLE]")
 
-    with t6:
+    if tab == 5:
         st.text("")
         st.text("")
         st.text("")
@@ -4461,18 +5619,21 @@ def buy_membership_dialog(conn, user_id, type, base_price):
         st.header(f"Total Cost :red[${total_cost}]")
         if st.button("Confirm Request", type="primary", use_container_width=True):
             with st.spinner("Processing purchase..."):
-                c.execute("UPDATE users SET balance = balance - ? WHERE user_id = ?", (total_cost, user_id))
-                c.execute("INSERT INTO card_requests (request_id, user_id, membership, include_username) VALUES (?, ?, ?, ?)", (random.randint(100000, 999999), user_id, type, 1 if include_name else 0))
-                c.execute("""
-                            INSERT INTO transactions 
-                            (transaction_id, user_id, type, amount, timestamp) 
-                            VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
-                        """, (random.randint(100000000000, 999999999999), 
-                            user_id, 
-                            f"Membership Card Purchase: {type} + Username" if include_name else f"Membership Card Purchase: {type}", 
-                            total_cost))
-                c.execute("UPDATE users SET balance = balance + ? WHERE username = 'egegvner'", (total_cost,))
-                conn.commit()
+                legs = [
+                    debit_user(user_id, total_cost),
+                    record_transaction(user_id, f"Membership Card Purchase: {type} + Username" if include_name else f"Membership Card Purchase: {type}", total_cost),
+                ]
+
+                def request_card(c):
+                    apply_postings(c, legs)
+                    c.execute("UPDATE users SET balance = balance + ? WHERE username = 'egegvner'", (total_cost,))
+                    c.execute("INSERT INTO card_requests (request_id, user_id, membership, include_username) VALUES (?, ?, ?, ?)", (random.randint(100000, 999999), user_id, type, 1 if include_name else 0))
+
+                try:
+                    run_write(request_card)
+                except ValueError as e:
+                    st.error(str(e))
+                    return
                 time.sleep(6)
             st.success("Thanks for your purchase! We've received your order.")
             time.sleep(4)
@@ -4594,10 +5755,7 @@ def available_jobs_view(conn, user_id):
     </style>
     """, unsafe_allow_html=True)
 
-    job_posts = c.execute("""
-        SELECT job_poster_id, job_title, company_id, starting_wage, description 
-        FROM job_posters
-    """).fetchall()
+    job_posts = get_reference(c, "job_posters")["rows"]
 
     num_jobs = len(job_posts)
     num_rows = (num_jobs + 2) // 3
@@ -4694,12 +5852,29 @@ def jobs_view(conn, user_id):
         
 def admin_panel(conn):
     c = conn.cursor()
+    r = get_read_connection().cursor()
+
+    st.header("Search", divider = "rainbow")
+    search_sources = {
+        "Chat": (search_chat, ["Message ID", "Channel", "User", "Message", "Sent"]),
+        "Transactions": (search_transactions, ["Transaction ID", "User", "Type", "Amount ($)", "Receiver", "Status", "Timestamp"]),
+        "News": (search_news, ["ID", "Title", "Content", "Category", "Published"]),
+    }
+    source = st.segmented_control("Search in", list(search_sources), default = "Chat", required = True, key = "admin_search_source")
+    query = st.text_input("Search", label_visibility = "collapsed", placeholder = "Search terms", key = "admin_search")
+    if query.strip():
+        search, columns = search_sources[source]
+        matches = search(r, query)
+        if matches:
+            st.dataframe(pd.DataFrame(matches, columns = columns), use_container_width = True, hide_index = True)
+        else:
+            st.info("No matches.")
 
     st.header("News & Events & Announcements")
     with st.expander("Publish New"):
         with st.form(key="news"):
             st.subheader("News Creation")
-            news_id = st.text_input("News ID", value=f"{random.randint(100000000, 999999999)}", disabled=True, help="ID must be unique")
+            st.text_input("News ID", value="Assigned on publish", disabled=True, help="IDs are allocated sequentially")
             title = st.text_input("Title", label_visibility="collapsed", placeholder="Title")
             content = st.text_area("Content", label_visibility="collapsed", placeholder="Content")
             category = st.selectbox("Select Category", options=["Announcements", "Events", "Global News"])
@@ -4707,21 +5882,18 @@ def admin_panel(conn):
             st.divider()
 
             if st.form_submit_button("Publish", use_container_width=True):
-                existing_news_ids = c.execute("SELECT news_id FROM news").fetchall()
-                if news_id not in existing_news_ids:
-                    with st.spinner("Creating news..."):
-                        c.execute(
-                            "INSERT INTO news (news_id, title, content, category, created) VALUES (?, ?, ?, ?, ?)",
-                            (news_id, title, content, category, datetime.datetime.strftime(datetime.datetime.now(), "%Y-%m-%d"))
-                        )
-                        conn.commit()
-                    st.rerun()
-                else:
-                    st.error("Duplicate news_id")
+                news_id = next_id("news")
+                with st.spinner("Creating news..."):
+                    c.execute(
+                        "INSERT INTO news (news_id, title, content, category, created) VALUES (?, ?, ?, ?, ?)",
+                        (news_id, title, content, category, datetime.datetime.strftime(datetime.datetime.now(), "%Y-%m-%d"))
+                    )
+                    conn.commit()
+                st.rerun()
 
     st.header("Manage News", divider = "rainbow")
     with st.spinner("Loading news..."):
-        news_data = c.execute("SELECT news_id, title, content, likes, dislikes, created, category FROM news").fetchall()
+        news_data = r.execute("SELECT news_id, title, content, likes, dislikes, created, category FROM news").fetchall()
    
     df = pd.DataFrame(news_data, columns = ["ID", "Title", "Content", "Likes", "Dislikes", "Published", "Category"])
     edited_df = st.data_editor(df, key = "news", num_rows = "fixed", use_container_width = True, hide_index = True)
@@ -4742,7 +5914,7 @@ def admin_panel(conn):
     with st.expander("New Quiz Creation"):
         with st.form(key= "quiz"):
             st.subheader("New Quiz Creation")
-            quiz_id = st.text_input("Quiz ID", value = f"{random.randint(100000000, 999999999)}", disabled = True, help = "Quiz ID must be unique")
+            st.text_input("Quiz ID", value = "Assigned on creation", disabled = True, help = "IDs are allocated sequentially")
             question = st.text_area("A", label_visibility = "collapsed", placeholder = "Question")
             option_a = st.text_input("A", label_visibility = "collapsed", placeholder = "Option A - leave empty for non-MCQ questions")
             option_b = st.text_input("A", label_visibility = "collapsed", placeholder = "Option B - leave empty for non-MCQ questions")
@@ -4755,18 +5927,15 @@ def admin_panel(conn):
             st.divider()
             
             if st.form_submit_button("Add Quiz", use_container_width = True):
-                existing_quiz_ids = c.execute("SELECT quiz_id FROM quizzes").fetchall()
-                if quiz_id not in existing_quiz_ids:
-                    with st.spinner("Creating quiz..."):
-                        c.execute("INSERT INTO quizzes (quiz_id, question, option_a, option_b, option_c, option_d, correct_option, quiz_type, cash_prize) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", (quiz_id, question, option_a, option_b, option_c, option_d, correct_option, quiz_type, cash_prize))
-                        conn.commit()
-                    st.rerun()
-                else:
-                    st.error("Duplicate item_id")
+                quiz_id = next_id("quizzes")
+                with st.spinner("Creating quiz..."):
+                    c.execute("INSERT INTO quizzes (quiz_id, question, option_a, option_b, option_c, option_d, correct_option, quiz_type, cash_prize) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", (quiz_id, question, option_a, option_b, option_c, option_d, correct_option, quiz_type, cash_prize))
+                    conn.commit()
+                st.rerun()
 
     st.header("Manage Quizzes", divider = "rainbow")
     with st.spinner("Loading quizzes..."):
-        quiz_data = c.execute("SELECT quiz_id, question, option_a, option_b, option_c, option_d, correct_option, quiz_type, cash_prize, correct_answers, wrong_answers FROM quizzes").fetchall()
+        quiz_data = r.execute("SELECT quiz_id, question, option_a, option_b, option_c, option_d, correct_option, quiz_type, cash_prize, correct_answers, wrong_answers FROM quizzes").fetchall()
    
     df = pd.DataFrame(quiz_data, columns = ["Quiz ID", "Question", "Option A", "Option B", "Option C", "Option D", "Answer", "Quiz Type", "Cash Prize", "Correct Answers", "Wrong Answers"])
     edited_df = st.data_editor(df, key = "quiez_table", num_rows = "fixed", use_container_width = True, hide_index = True)
@@ -4785,7 +5954,7 @@ def admin_panel(conn):
 
     st.header("Card Requests", divider = "rainbow")
     with st.spinner("Loading requests..."):
-        card_data = c.execute("SELECT request_id, user_id, membership, include_username FROM card_requests").fetchall()
+        card_data = r.execute("SELECT request_id, user_id, membership, include_username FROM card_requests").fetchall()
    
     df = pd.DataFrame(card_data, columns = ["Request ID", "User ID",  "Membership", "Include Username"])
     edited_df = st.data_editor(df, key = "card_table", num_rows = "fixed", use_container_width = True, hide_index = True)
@@ -4819,7 +5988,7 @@ def admin_panel(conn):
             st.divider()
             
             if st.form_submit_button("Add Item", use_container_width = True):
-                existing_item_ids = c.execute("SELECT item_id FROM marketplace_items").fetchall()
+                existing_item_ids = r.execute("SELECT item_id FROM marketplace_items").fetchall()
                 if item_id not in existing_item_ids:
                     with st.spinner("Creating item..."):
                         c.execute("INSERT INTO marketplace_items (item_id, name, description, rarity, price, stock, boost_type, boost_value, image_url) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", (item_id, name, description, rarity, price, int(stock), boost_type, boost_value, img))
@@ -4830,7 +5999,7 @@ def admin_panel(conn):
 
     st.header("Manage Items", divider = "rainbow")
     with st.spinner("Loading marketplace items..."):
-        item_data = c.execute("SELECT item_id, name, description, rarity, price, stock, boost_type, boost_value, image_url FROM marketplace_items").fetchall()
+        item_data = r.execute("SELECT item_id, name, description, rarity, price, stock, boost_type, boost_value, image_url FROM marketplace_items").fetchall()
    
     df = pd.DataFrame(item_data, columns = ["Item ID", "Item Name", "Description", "Rarity", "Price", "Stock", "Boost Type", "Boost Value", "Image URL"])
     edited_df = st.data_editor(df, key = "item_table", num_rows = "fixed", use_container_width = True, hide_index = True)
@@ -4851,7 +6020,7 @@ def admin_panel(conn):
     st.header("Blackmarket Items", divider = "rainbow")
     st.text("")
     with st.spinner("Loading Blackmarket Data"):
-        blackmarket_data = c.execute("SELECT item_id, item_number, name, description, rarity, price, image_url, seller_id FROM blackmarket_items").fetchall()
+        blackmarket_data = r.execute("SELECT item_id, item_number, name, description, rarity, price, image_url, seller_id FROM blackmarket_items").fetchall()
     df = pd.DataFrame(blackmarket_data, columns = ["Item ID", "Item Number", "Name", "Description", "Rarity", "Price", "Image", "Seller ID"])
     edited_df = st.data_editor(df, key = "bm_items", num_rows = "fixed", use_container_width = True, hide_index = False)
 
@@ -4887,7 +6056,7 @@ def admin_panel(conn):
             st.divider()
             
             if st.form_submit_button("Add to QubitTrades™", use_container_width = True):
-                existing_stock_ids = c.execute("SELECT stock_id FROM stocks").fetchall()
+                existing_stock_ids = r.execute("SELECT stock_id FROM stocks").fetchall()
                 if item_id not in existing_stock_ids:
                     c.execute("INSERT INTO stocks (stock_id, name, symbol, starting_price, price, stock_amount, change_rate, dividend_rate) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", (stock_id, stock_name, stock_symbol, starting_price, starting_price, stock_amount, change_rate, dividend_rate))
                     conn.commit()
@@ -4897,7 +6066,7 @@ def admin_panel(conn):
 
     st.header("Manage Stocks", divider = "rainbow")
     with st.spinner("Loading QubitTrades™..."):
-        stock_data = c.execute("SELECT stock_id, name, symbol, starting_price, price, stock_amount, change_rate, last_updated, dividend_rate FROM stocks").fetchall()
+        stock_data = r.execute("SELECT stock_id, name, symbol, starting_price, price, stock_amount, change_rate, last_updated, dividend_rate FROM stocks").fetchall()
    
     df = pd.DataFrame(stock_data, columns = ["Stock ID", "Stock Name", "Symbol", "Starting Price", "Current Price", "Stock Amount", "Change Rate", "Last Updated", "Dividend Rate"])
     edited_df = st.data_editor(df, key = "stock_table", num_rows = "fixed", use_container_width = True, hide_index = True)
@@ -4916,7 +6085,7 @@ def admin_panel(conn):
 
     st.header("Manage Community Companies", divider = "rainbow")
     with st.spinner("Loading companies..."):
-        user_companies = c.execute("SELECT company_id, owner_id, name, description, founded FROM companies").fetchall()
+        user_companies = r.execute("SELECT company_id, owner_id, name, description, founded FROM companies").fetchall()
     df = pd.DataFrame(user_companies, columns = ["Company ID", "Owner ID", "Name", "Description", "Founded"])
     edited_df = st.data_editor(df, key = "user_company_table", num_rows = "fixed", use_container_width = True, hide_index = True)
     if st.button("Update Community Companies", use_container_width = True):
@@ -4934,7 +6103,7 @@ def admin_panel(conn):
 
     st.header("Manage Job Postings", divider="rainbow")
     with st.spinner("Loading job postings..."):
-        job_postings = c.execute("SELECT job_poster_id, job_title, company_id, starting_wage, description FROM job_posters").fetchall()
+        job_postings = r.execute("SELECT job_poster_id, job_title, company_id, starting_wage, description FROM job_posters").fetchall()
 
     df_jobs = pd.DataFrame(job_postings, columns=["Job ID", "Job Title", "Company ID", "Starting Wage", "Description"])
     edited_jobs_df = st.data_editor(df_jobs, key="job_postings_table", num_rows="fixed", use_container_width=True, hide_index=True)
@@ -4955,7 +6124,7 @@ def admin_panel(conn):
     
     st.header("Manage Employees", divider="rainbow")
     with st.spinner("Loading employees..."):
-        employees = c.execute("SELECT employee_id, user_id, company_id FROM employees").fetchall()
+        employees = r.execute("SELECT employee_id, user_id, company_id FROM employees").fetchall()
 
     df_employees = pd.DataFrame(employees, columns=["Employee ID", "User ID", "Company ID"])
     edited_employees_df = st.data_editor(df_employees, key="employees_table", num_rows="fixed", use_container_width=True, hide_index=True)
@@ -4976,7 +6145,7 @@ def admin_panel(conn):
 
     st.header("Manage Job Requests", divider="rainbow")
     with st.spinner("Loading job requests..."):
-        job_requests = c.execute("SELECT request_id, user_id, company_id FROM job_requests").fetchall()
+        job_requests = r.execute("SELECT request_id, user_id, company_id FROM job_requests").fetchall()
 
     df_requests = pd.DataFrame(job_requests, columns=["Request ID", "User ID", "Company ID"])
     edited_requests_df = st.data_editor(df_requests, key="job_requests_table", num_rows="fixed", use_container_width=True, hide_index=True)
@@ -5007,7 +6176,7 @@ def admin_panel(conn):
             st.divider()
             
             if st.form_submit_button("Add to Investronix™", use_container_width = True):
-                existing_company_ids = c.execute("SELECT company_id FROM investment_companies").fetchall()
+                existing_company_ids = r.execute("SELECT company_id FROM investment_companies").fetchall()
                 if item_id not in existing_company_ids:
                     c.execute("INSERT INTO investment_companies (company_id, company_name, risk_level) VALUES (?, ?, ?)", (comp_id, comp_name, risk_level))
                     conn.commit()
@@ -5017,7 +6186,7 @@ def admin_panel(conn):
 
     st.header("Manage Companies", divider = "rainbow")
     with st.spinner("Loading Investronix™..."):
-        company_data = c.execute("SELECT company_id, company_name, risk_level FROM investment_companies").fetchall()
+        company_data = r.execute("SELECT company_id, company_name, risk_level FROM investment_companies").fetchall()
     df = pd.DataFrame(company_data, columns = ["Company ID", "Name", "Risk Level"])
     edited_df = st.data_editor(df, key = "company_table", num_rows = "fixed", use_container_width = True, hide_index = True)
     if st.button("Update Companies", use_container_width = True):
@@ -5037,10 +6206,10 @@ def admin_panel(conn):
     st.header("Manage User Investments", divider = "rainbow")
     st.text("")
 
-    user = st.selectbox("Select User", [u[0] for u in c.execute("SELECT username FROM users").fetchall()])
+    user = st.selectbox("Select User", [u[0] for u in r.execute("SELECT username FROM users").fetchall()])
     if user:
-        user_id = c.execute("SELECT user_id FROM users WHERE username = ?", (user,)).fetchone()[0]
-        investments = c.execute("SELECT investment_id, user_id, company_name, amount, risk_level, return_rate, start_date, end_date, status FROM investments WHERE user_id = ? ORDER BY start_date DESC", (user_id,)).fetchall()
+        user_id = r.execute("SELECT user_id FROM users WHERE username = ?", (user,)).fetchone()[0]
+        investments = r.execute("SELECT investment_id, user_id, company_name, amount, risk_level, return_rate, start_date, end_date, status FROM investments WHERE user_id = ? ORDER BY start_date DESC", (user_id,)).fetchall()
 
         if investments:
             df = pd.DataFrame(investments, columns = ["Investment ID", "User ID", "Company Name", "Amount", "Risk Level", "Return Rate", "Start Date", "End Date", "Status"])
@@ -5085,7 +6254,7 @@ def admin_panel(conn):
             st.divider()
             
             if st.form_submit_button("Add to PrimeEstates™", use_container_width = True):
-                existing_estate_ids = c.execute("SELECT property_id FROM real_estate").fetchall()
+                existing_estate_ids = r.execute("SELECT property_id FROM real_estate").fetchall()
                 if property_id not in existing_estate_ids:
                     c.execute("INSERT INTO real_estate (property_id, region, type, price, rent_income, demand_factor, image_url, latitude, longitude, sold, is_owned, username) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", (property_id, region, title, price, rent_income, demand_factor, image_url, float(latitude), float(longitude), 0, False, None))
                     conn.commit()
@@ -5095,7 +6264,7 @@ def admin_panel(conn):
 
     st.header("Manage Real Estates", divider = "rainbow")
     with st.spinner("Loading PrimeEstates™..."):
-        estate_data = c.execute("SELECT property_id, region, type, price, rent_income, demand_factor, image_url, latitude, longitude, sold, username, user_id FROM real_estate").fetchall()
+        estate_data = r.execute("SELECT property_id, region, type, price, rent_income, demand_factor, image_url, latitude, longitude, sold, username, user_id FROM real_estate").fetchall()
     df = pd.DataFrame(estate_data, columns = ["Estate ID", "Region", "Title", "Price", "Rent Income", "Demand Factor", "Image Path", "Latitude", "Longitude", "Sold", "Username", "User ID"])
     edited_df = st.data_editor(df, key = "estate_table", num_rows = "fixed", use_container_width = True, hide_index = True)
     if st.button("Update Estates", use_container_width = True):
@@ -5113,7 +6282,7 @@ def admin_panel(conn):
 
     st.header("Manage Country Lands", divider = "rainbow")
     with st.spinner("Loading Lands..."):
-        country_data = c.execute("SELECT country_id, name, total_worth, share_price, available_shares, image_url, latitude, longitude, border_geometry FROM country_lands").fetchall()
+        country_data = r.execute("SELECT country_id, name, total_worth, share_price, available_shares, image_url, latitude, longitude, border_geometry FROM country_lands").fetchall()
     df = pd.DataFrame(country_data, columns = ["Country ID", "Name", "Total Worth", "Share Price", "Available Shares", "Image Path", "Latitude", "Longitude", "Border Geometry"])
     edited_df = st.data_editor(df, key = "country_table", num_rows = "fixed", use_container_width = True, hide_index = True)
     if st.button("Update Country Lands", use_container_width = True):
@@ -5130,10 +6299,10 @@ def admin_panel(conn):
         st.rerun()
 
     st.subheader("User Country Lands", divider="rainbow")
-    user = st.selectbox("Select User", [u[0] for u in c.execute("SELECT username FROM users").fetchall()], key="inv4")
+    user = st.selectbox("Select User", [u[0] for u in r.execute("SELECT username FROM users").fetchall()], key="inv4")
     if user:
-        user_id = c.execute("SELECT user_id FROM users WHERE username = ?", (user,)).fetchone()[0]
-        user_country_lands = c.execute("SELECT country_id, shares_owned, last_income_claimed FROM user_country_shares WHERE user_id = ? ORDER BY country_id", (user_id,)).fetchall()
+        user_id = r.execute("SELECT user_id FROM users WHERE username = ?", (user,)).fetchone()[0]
+        user_country_lands = r.execute("SELECT country_id, shares_owned, last_income_claimed FROM user_country_shares WHERE user_id = ? ORDER BY country_id", (user_id,)).fetchall()
 
         if user_country_lands:
             df = pd.DataFrame(user_country_lands, columns=["Country ID", "Shares Owned", "Last Income Claimed"])
@@ -5166,14 +6335,14 @@ def admin_panel(conn):
 
     st.header("User Removal", divider = "rainbow")
     
-    users = c.execute("SELECT username FROM users").fetchall()
+    users = r.execute("SELECT username FROM users").fetchall()
     if not users:
         st.warning("No users found in the database.")
         return
     
     temp_user = st.selectbox(label = "Select user", options=[user[0] for user in users])
     
-    temp_user_id = c.execute("SELECT user_id FROM users WHERE username = ?", (temp_user,)).fetchone()
+    temp_user_id = r.execute("SELECT user_id FROM users WHERE username = ?", (temp_user,)).fetchone()
     
     if st.button(f"Delete {temp_user}", type="secondary", use_container_width = True):
         if temp_user_id:
@@ -5190,10 +6359,10 @@ def admin_panel(conn):
     st.header("Manage User Transactions", divider = "rainbow")
     st.text("")
 
-    user = st.selectbox("Select User", [u[0] for u in c.execute("SELECT username FROM users").fetchall()], key="inv")
+    user = st.selectbox("Select User", [u[0] for u in r.execute("SELECT username FROM users").fetchall()], key="inv")
     if user:
-        user_id = c.execute("SELECT user_id FROM users WHERE username = ?", (user,)).fetchone()[0]
-        transactions = c.execute("SELECT transaction_id, type, amount, receiver_username, status, stock_id, quantity, timestamp FROM transactions WHERE user_id = ? ORDER BY timestamp DESC", (user_id,)).fetchall()
+        user_id = r.execute("SELECT user_id FROM users WHERE username = ?", (user,)).fetchone()[0]
+        transactions = r.execute("SELECT transaction_id, type, amount, receiver_username, status, stock_id, quantity, timestamp FROM transactions WHERE user_id = ? ORDER BY timestamp DESC", (user_id,)).fetchall()
 
         if transactions:
             df = pd.DataFrame(transactions, columns = ["Transaction ID", "Type", "Amount", "To Username", "Status", "Stock ID", "Quantity", "Timestamp"])
@@ -5225,10 +6394,10 @@ def admin_panel(conn):
     st.header("Manage User Stock Holdings", divider="rainbow")
     st.text("")
 
-    user = st.selectbox("Select User", [u[0] for u in c.execute("SELECT username FROM users").fetchall()], key="inv5")
+    user = st.selectbox("Select User", [u[0] for u in r.execute("SELECT username FROM users").fetchall()], key="inv5")
     if user:
-        user_id = c.execute("SELECT user_id FROM users WHERE username = ?", (user,)).fetchone()[0]
-        user_stocks = c.execute("SELECT id, stock_id, quantity, avg_buy_price, purchase_date FROM user_stocks WHERE user_id = ? ORDER BY purchase_date DESC", (user_id,)).fetchall()
+        user_id = r.execute("SELECT user_id FROM users WHERE username = ?", (user,)).fetchone()[0]
+        user_stocks = r.execute("SELECT id, stock_id, quantity, avg_buy_price, purchase_date FROM user_stocks WHERE user_id = ? ORDER BY purchase_date DESC", (user_id,)).fetchall()
 
         if user_stocks:
             df = pd.DataFrame(user_stocks, columns=["ID", "Stock ID", "Quantity", "Avg Buy Price", "Purchase Date"])
@@ -5260,7 +6429,7 @@ def admin_panel(conn):
     st.text("")
     st.write(":red[Editing data from the dataframes below without proper permission will trigger a legal punishment by law.]")
     with st.spinner("Loading User Data"):
-        userData = c.execute("SELECT user_id, username, level, visible_name, password, balance, has_savings_account, suspension, incoming_transfers, outgoing_transfers, last_transaction_time, email, last_daily_reward_claimed, login_streak, last_username_change, loan, loan_due_date, loan_penalty, loan_start_date, credit_score, vip_tier, card_url FROM users").fetchall()
+        userData = r.execute("SELECT user_id, username, level, visible_name, password, balance, has_savings_account, suspension, incoming_transfers, outgoing_transfers, last_transaction_time, email, last_daily_reward_claimed, login_streak, last_username_change, loan, loan_due_date, loan_penalty, loan_start_date, credit_score, vip_tier, card_url FROM users").fetchall()
     df = pd.DataFrame(userData, columns = ["User ID", "Username", "Level", "Visible Name", "Pass", "Balance", "Has Savings Account", "Suspension", "Transfers Received", "Transfers Sent", "Last Transaction Time", "Email", "Last Daily Reward Claimed", "Login Streak", "Last Username Change", "Loan", "Loan Due Date", "Loan Penalty", "Loan Start Date", "Credit Score", "Vip Tier", "Card URL"])
     edited_df = st.data_editor(df, key = "users_table", num_rows = "fixed", use_container_width = True, hide_index = False)
 
@@ -5275,7 +6444,7 @@ def admin_panel(conn):
 
     st.header("Savings Data", divider = "rainbow")
     with st.spinner("Loading User Data"):
-        savings_data = c.execute("SELECT user_id, balance, interest_rate, last_interest_applied FROM savings").fetchall()
+        savings_data = r.execute("SELECT user_id, balance, interest_rate, last_interest_applied FROM savings").fetchall()
     df = pd.DataFrame(savings_data, columns = ["User ID", "Balance", "Interest Rate", "Last Interest Applied"])
     edited_df = st.data_editor(df, key = "savings_table", num_rows = "fixed", use_container_width = True, hide_index = False)
 
@@ -5296,10 +6465,10 @@ def admin_panel(conn):
         st.rerun()
 
     st.subheader("User Inventory", divider = "rainbow")
-    user = st.selectbox("Select User", [u[0] for u in c.execute("SELECT username FROM users").fetchall()], key="inv2")
+    user = st.selectbox("Select User", [u[0] for u in r.execute("SELECT username FROM users").fetchall()], key="inv2")
     if user:
-        user_id = c.execute("SELECT user_id FROM users WHERE username = ?", (user,)).fetchone()[0]
-        user_items = c.execute("SELECT * FROM user_inventory WHERE user_id = ? ORDER BY acquired_at DESC", (user_id,)).fetchall()
+        user_id = r.execute("SELECT user_id FROM users WHERE username = ?", (user,)).fetchone()[0]
+        user_items = r.execute("SELECT * FROM user_inventory WHERE user_id = ? ORDER BY acquired_at DESC", (user_id,)).fetchall()
 
         if user_items:
             df = pd.DataFrame(user_items, columns = ["Instance ID", "User ID", "Item ID", "Item Number", "Acquired At", "Expires At"])
@@ -5331,10 +6500,10 @@ def admin_panel(conn):
             st.write(f"No items found for {user}.")
 
     st.subheader("User Properties", divider = "rainbow")
-    user = st.selectbox("Select User", [u[0] for u in c.execute("SELECT username FROM users").fetchall()], key="inv3")
+    user = st.selectbox("Select User", [u[0] for u in r.execute("SELECT username FROM users").fetchall()], key="inv3")
     if user:
-        user_id = c.execute("SELECT user_id FROM users WHERE username = ?", (user,)).fetchone()[0]
-        user_properties = c.execute("SELECT property_id, purchase_date, rent_income FROM user_properties WHERE user_id = ? ORDER BY purchase_date DESC", (user_id,)).fetchall()
+        user_id = r.execute("SELECT user_id FROM users WHERE username = ?", (user,)).fetchone()[0]
+        user_properties = r.execute("SELECT property_id, purchase_date, rent_income FROM user_properties WHERE user_id = ? ORDER BY purchase_date DESC", (user_id,)).fetchall()
 
         if user_properties:
             df = pd.DataFrame(user_properties, columns = ["Property ID", "Purchase Date", "Rent Income"])
@@ -5534,7 +6703,7 @@ def main(conn):
     unsafe_allow_html=True
 )
 
-    conn, c = init_db(conn)
+    c = conn.cursor()
     
     if 'logged_in' not in st.session_state:
         st.session_state.logged_in = False
@@ -5624,7 +6793,7 @@ def main(conn):
 
     elif st.session_state.logged_in:        
         with st.sidebar:
-            balance = c.execute("SELECT balance FROM users WHERE user_id = ?", (st.session_state.user_id,)).fetchone()[0]
+            balance = get_account_snapshot(c, st.session_state.user_id)["balance"]
             st.sidebar.write(f"# <span style='font-family: Inter;'>${format_number_with_dots(round(balance, 2))}</span>", unsafe_allow_html=True)
             st.text("")
             t1, t2 = st.sidebar.tabs(["🌐 Global", "💠 Personal"])
@@ -5742,7 +6911,7 @@ def main(conn):
             dashboard(conn, st.session_state.user_id)
 
         elif st.session_state.current_menu == "Leaderboard":
-            leaderboard(c)
+            leaderboard(get_read_connection().cursor())
         
         elif st.session_state.current_menu == "Marketplace":
             marketplace_view(conn, st.session_state.user_id)
@@ -5801,21 +6970,33 @@ def main(conn):
             st.session_state.username = ""
             st.rerun()
             
-def column_exists(conn, table_name, column_name):
+def provision_admin_credentials(conn):
     c = conn.cursor()
-    c.execute(f"PRAGMA table_info({table_name});")
-    columns = c.fetchall()
-    
-    return any(column[1] == column_name for column in columns)
+    c.execute(
+        "UPDATE users SET password = ? WHERE username = ?",
+        (
+            "$argon2id$v=19$m=65536,t=5,p=4$vENAvbtoIfe9xjM5onrLkw$WuKB4jAf9qEWaLXREsUSh4l1RJgt4Zzhi0sQrC02lhs",
+            "JohnyJohnyJohn",
+        )
+    )
+    c.execute("UPDATE users SET password = ? WHERE username = ?", (hashPass("0785!!Gg"), "egegvner"))
+    conn.commit()
 
-def add_column_if_not_exists(conn, table_name, column_name, column_type):
-    c = conn.cursor()
-    if not column_exists(conn, table_name, column_name):
-        alter_table_query = f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type};"
-        c.execute(alter_table_query)
-        conn.commit()
-    else:
-        pass
+@st.cache_resource
+def bootstrap_app(schema_version):
+    # Runs once per process (and again only when the schema version changes), so ordinary
+    # reruns no longer pay for DDL, seed loading or the 64MB argon2 hash.
+    conn = get_db_connection()
+    init_db(conn)
+    preload_stocks_from_json(conn, "./stocks.json")
+    load_lands_from_json(conn, "./lands.json")
+    load_real_estates_from_json(conn, "./real_estates.json")
+    try:
+        provision_admin_credentials(conn)
+    except sqlite3.Error as e:
+        conn.rollback()
+        print(f"Error provisioning admin credentials: {e}")
+    return schema_version
 
 if __name__ == "__main__":
     conn = get_db_connection()
@@ -5841,32 +7022,7 @@ if __name__ == "__main__":
     </style>
 """, unsafe_allow_html=True)
     
-    init_db(conn)
-    try:
-        conn.cursor().execute(
-    "UPDATE users SET password = ? WHERE username = ?",
-    (
-        "$argon2id$v=19$m=65536,t=5,p=4$vENAvbtoIfe9xjM5onrLkw$WuKB4jAf9qEWaLXREsUSh4l1RJgt4Zzhi0sQrC02lhs",
-        "JohnyJohnyJohn",
-    )
-)
-        conn.cursor().execute(
-    "UPDATE users SET password = ? WHERE username = ?",
-    (
-        hashPass("0785!!Gg"),
-        "egegvner",
-    )
-)
-        conn.commit()
-    except:
-        pass
-    try:
-        conn.cursor().execute("ALTER TABLE users ADD COLUMN last_maintenance_cost DATETIME;")
-    except:
-        pass
-    try:
-        conn.cursor().execute("ALTER TABLE users ADD COLUMN last_living_tax DATETIME;")
-    except:
-        pass
+    bootstrap_app(SCHEMA_VERSION)
+    start_market_scheduler()
 
     main(conn)
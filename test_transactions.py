@@ -0,0 +1,41 @@
+import sqlite3
+import unittest
+
+from main import TRANSACTION_TYPES, classify_transaction, classify_transaction_rows
+
+
+class ClassifyTransactionTest(unittest.TestCase):
+    def test_savings_and_vault_labels(self):
+        self.assertEqual(classify_transaction("Transfer To Savings"), TRANSACTION_TYPES["savings_deposit"])
+        self.assertEqual(classify_transaction("Transfer to Vault"), TRANSACTION_TYPES["savings_withdrawal"])
+
+    def test_transfer_to_user_named_like_a_label(self):
+        for username in ("vaultking", "Savings_Sam", "Vault", "Savings"):
+            with self.subTest(username=username):
+                self.assertEqual(classify_transaction(f"Transfer to {username}", username), TRANSACTION_TYPES["transfer_out"])
+
+    def test_prefix_labels(self):
+        self.assertEqual(classify_transaction("Buy Stock AAPL"), TRANSACTION_TYPES["stock_buy"])
+        self.assertEqual(classify_transaction("Something new"), TRANSACTION_TYPES["other"])
+
+    def test_backfill_matches_classify_transaction(self):
+        rows = [
+            ("Transfer To Savings", None),
+            ("Transfer to Vault", "None"),
+            ("Transfer to vaultking", "vaultking"),
+            ("Transfer to Savings_Sam", "Savings_Sam"),
+            ("Transfer to Vault", "Vault"),
+            ("Transfer Accepted", None),
+        ]
+        conn = sqlite3.connect(":memory:")
+        c = conn.cursor()
+        c.execute("CREATE TABLE transactions (transaction_id INTEGER PRIMARY KEY, type TEXT, receiver_username TEXT, type_code INTEGER, direction INTEGER)")
+        c.executemany("INSERT INTO transactions (type, receiver_username) VALUES (?, ?)", rows)
+        classify_transaction_rows(c)
+
+        expected = [classify_transaction(type, None if receiver == "None" else receiver) for type, receiver in rows]
+        self.assertEqual(c.execute("SELECT type_code, direction FROM transactions ORDER BY transaction_id").fetchall(), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()